@@ -1,6 +1,8 @@
-from fastapi import FastAPI, UploadFile, File, HTTPException, Depends
-from datetime import date, timedelta
-from sqlalchemy import create_engine, func
+from fastapi import FastAPI, UploadFile, File, HTTPException, Depends, Request, Response
+from fastapi.encoders import jsonable_encoder
+from datetime import date, datetime, timedelta, timezone
+from sqlalchemy import create_engine, func, literal, literal_column, tuple_, cast, Integer
+from sqlalchemy.exc import ProgrammingError
 from sqlalchemy.orm import sessionmaker, Session
 from sqlalchemy.ext.declarative import declarative_base
 from dotenv import load_dotenv
@@ -8,11 +10,15 @@ from llama_index.llms.google_genai import GoogleGenAI
 from llama_index.embeddings.google_genai import GoogleGenAIEmbedding
 from llama_index.core import Settings
 from datetime import date
-from .db import Ingestor, QueryEngine, QueryLog, CitedDocument
+from .db import Ingestor, QueryEngine, QueryLog, CitedDocument, QueryTopic
+from .cache import ResultCache
+from .admission import AdmissionError, DeadlineExceededError
+from .schema import QUERY_LOG_SEARCH_TEXT, list_partition_months, month_start, add_months
 from .models import (
     QueryEngineResponse, 
     LLMResponseMetrics, 
     TopQueriedDocument, 
+    TopQueryTopic,
     QueryLogVolumeMetrics,
     UserQuery,
     Timeframe,
@@ -21,10 +27,17 @@ from .models import (
     QueryLogInput,
     QueryLogOutput,
     Citation,
-    TopSimilarDocument
+    TopSimilarDocument,
+    CacheStats,
+    AdmissionStats,
+    VectorReplicaStats
 )
 import os
+import time
+import json
+import hashlib
 import logging
+from typing import Optional
 from fastapi.middleware.cors import CORSMiddleware
 
 # Configure logging
@@ -60,6 +73,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],  # Allow all methods
     allow_headers=["*"],  # Allow all headers
+    expose_headers=["ETag"],  # Let the frontend read ETags for conditional requests
 )
 
 # Database setup
@@ -83,6 +97,57 @@ query_engine = QueryEngine(ingestor=ingestor)
 # Get TEMP_DIR from environment variables
 TEMP_DIR = os.getenv("TEMP_DIR", "../temp")
 
+# Result cache for the dashboard analytics endpoints
+analytics_cache = ResultCache(
+    max_bytes=int(os.getenv("ANALYTICS_CACHE_MAX_BYTES", 8 * 1024 * 1024)),
+)
+# Windows that ended in the past never change, windows that include today do
+ANALYTICS_CACHE_CLOSED_TTL = float(os.getenv("ANALYTICS_CACHE_CLOSED_TTL", 24 * 60 * 60))
+ANALYTICS_CACHE_OPEN_TTL = float(os.getenv("ANALYTICS_CACHE_OPEN_TTL", 10))
+
+def is_closed_window(end_date: date) -> bool:
+    """Check whether a window ending on `end_date` (inclusive) lies fully in the past."""
+    # Timestamps are stored in UTC, so the window must be over in both UTC and local time
+    return end_date < min(date.today(), datetime.now(timezone.utc).date())
+
+def cached_analytics(request: Request, key: tuple, end_date: date, compute) -> Response:
+    """
+    Serve an analytics result from the result cache, computing and caching it on a miss.
+    Responses carry `ETag` and `Cache-Control` headers, and GET requests whose
+    `If-None-Match` header matches the current ETag get an empty 304.
+    """
+    result = analytics_cache.get_result(key)
+    if result is None:
+        body = json.dumps(jsonable_encoder(compute())).encode()
+        etag = '"%s"' % hashlib.sha1(body).hexdigest()
+        ttl = ANALYTICS_CACHE_CLOSED_TTL if is_closed_window(end_date) else ANALYTICS_CACHE_OPEN_TTL
+        result = analytics_cache.put_result(key, etag, body, ttl)
+
+    etag, body, expires_at = result
+    headers = {
+        "ETag": etag,
+        "Cache-Control": f"private, max-age={max(int(expires_at - time.time()), 0)}",
+    }
+    if_none_match = request.headers.get("if-none-match", "")
+    if request.method == "GET" and etag in [tag.strip() for tag in if_none_match.split(",")]:
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+# Number of most recent matches of a query log search that are ranked by relevance
+QUERY_LOG_SEARCH_CANDIDATES = int(os.getenv("QUERY_LOG_SEARCH_CANDIDATES", 2000))
+
+# LLM and embedding calls that are rejected or time out tell the client when to retry
+def admission_error_response(error: AdmissionError) -> HTTPException:
+    """
+    Turn a rejected or timed out LLM or embedding call into a 504 (deadline exceeded)
+    or 503 (overloaded, or circuit open) response that tells the client when to retry.
+    """
+    return HTTPException(
+        status_code=504 if isinstance(error, DeadlineExceededError) else 503,
+        detail=str(error),
+        headers={"Retry-After": str(error.retry_after)},
+    )
+
 # Endpoint to upload support documents
 @app.post("/upload-docs/")
 async def upload_docs(files: list[UploadFile] = File(...)):
@@ -109,22 +174,27 @@ async def upload_docs(files: list[UploadFile] = File(...)):
 
 # Endpoint to get query log volume per day, week, and month
 @app.get("/query-log-volume/", response_model=QueryLogVolumeMetrics)
-async def get_query_log_volume(db: Session = Depends(get_db)):
+async def get_query_log_volume(request: Request, db: Session = Depends(get_db)):
     """Get query log volume per day, week, and month."""
     today = date.today()
-    daily_volume = db.query(func.count(QueryLog.id)).filter(func.date(QueryLog.timestamp) == today).scalar()
-    weekly_volume = db.query(func.count(QueryLog.id)).filter(QueryLog.timestamp >= today - timedelta(days=7)).scalar()
-    monthly_volume = db.query(func.count(QueryLog.id)).filter(QueryLog.timestamp >= today - timedelta(days=30)).scalar()
-
-    return QueryLogVolumeMetrics(
-        daily_count=daily_volume,
-        weekly_count=weekly_volume,
-        monthly_count=monthly_volume
-    )
+
+    def compute():
+        # Compare `timestamp` against ranges rather than `date(timestamp)`, so old partitions are pruned
+        daily_volume = db.query(func.count(QueryLog.id)).filter(QueryLog.timestamp >= today, QueryLog.timestamp < today + timedelta(days=1)).scalar()
+        weekly_volume = db.query(func.count(QueryLog.id)).filter(QueryLog.timestamp >= today - timedelta(days=7)).scalar()
+        monthly_volume = db.query(func.count(QueryLog.id)).filter(QueryLog.timestamp >= today - timedelta(days=30)).scalar()
+
+        return QueryLogVolumeMetrics(
+            daily_count=daily_volume,
+            weekly_count=weekly_volume,
+            monthly_count=monthly_volume
+        )
+
+    return cached_analytics(request, ("query-log-volume", today), today, compute)
 
 # Endpoint to get top K queried documents
 @app.post("/top-queried-documents/", response_model=list[TopQueriedDocument])
-async def get_top_queried_documents(query: TopKDocCiteQuery, db: Session = Depends(get_db)):
+async def get_top_queried_documents(query: TopKDocCiteQuery, request: Request, db: Session = Depends(get_db)):
     """Get top K queried documents."""
     k = query.k
     start_date = query.start_date
@@ -142,24 +212,95 @@ async def get_top_queried_documents(query: TopKDocCiteQuery, db: Session = Depen
     if end_date is None:
         end_date = date.today()
 
-    # If k is None, return all documents
-    query = db.query(CitedDocument.file_path, func.count(CitedDocument.file_path).label("count"))
-    query = query.join(QueryLog, CitedDocument.query_log_id == QueryLog.id)
-    query = query.filter(QueryLog.timestamp >= start_date, QueryLog.timestamp <= end_date + timedelta(days=1))
-    query = query.group_by(CitedDocument.file_path)
-    query = query.order_by(func.count(CitedDocument.file_path).desc())
-    
-    if k is not None:
-        query = query.limit(k)
+    def compute():
+        # If k is None, return all documents
+        query = db.query(CitedDocument.file_path, func.count(CitedDocument.file_path).label("count"))
+        # Cited documents share their query log's timestamp, so both tables' partitions are pruned
+        query = query.filter(CitedDocument.timestamp >= start_date, CitedDocument.timestamp <= end_date + timedelta(days=1))
+        query = query.group_by(CitedDocument.file_path)
+        query = query.order_by(func.count(CitedDocument.file_path).desc())
+        
+        if k is not None:
+            query = query.limit(k)
+
+        top_docs = query.all()
+
+        return [TopQueriedDocument(file_path=file_path, count=count) for file_path, count in top_docs]
 
-    top_docs = query.all()
+    return cached_analytics(request, ("top-queried-documents", k, start_date, end_date), end_date, compute)
 
-    result = [TopQueriedDocument(file_path=file_path, count=count) for file_path, count in top_docs]
-    return result
+@app.get("/top-queried-documents/", response_model=list[TopQueriedDocument])
+async def get_top_queried_documents_conditional(request: Request, query: TopKDocCiteQuery = Depends(), db: Session = Depends(get_db)):
+    """Get top K queried documents, with the parameters in the query string to allow conditional requests."""
+    return await get_top_queried_documents(query, request, db)
+
+# Endpoint to get the top K topics of the queries for a timeframe
+@app.get("/query-topics/", response_model=list[TopQueryTopic])
+async def get_query_topics(request: Request, query: TopKDocCiteQuery = Depends(), db: Session = Depends(get_db)):
+    """Get the top K query topics by number of queries, with their success rate and latency."""
+    k = query.k
+    start_date = query.start_date
+    end_date = query.end_date
+
+    if k is not None and k <= 0:
+        raise HTTPException(status_code=400, detail="K must be a positive integer")
+
+    if start_date is None:
+        # If start_date is None, get all records up to end_date
+        start_date = date(1970, 1, 1)  # Use a very old date as the starting point
+
+    if end_date is not None and end_date < start_date:
+        raise HTTPException(status_code=400, detail="End date must be greater than or equal to start date")
+    if end_date is None:
+        end_date = date.today()
+
+    # Topics are updated by a separate job, so past windows are only cached until its next run
+    topics_version = db.query(func.max(QueryTopic.updated_at)).scalar()
+
+    def compute():
+        window = (
+            QueryLog.timestamp >= start_date,
+            QueryLog.timestamp <= end_date + timedelta(days=1),
+            QueryLog.topic_id.isnot(None),
+        )
+        total_count = db.query(func.count(QueryLog.id)).filter(*window).scalar()
+
+        count = func.count(QueryLog.id).label("count")
+        query = db.query(
+            QueryLog.topic_id,
+            count,
+            func.avg(cast(QueryLog.success, Integer)).label("success_rate"),
+            func.avg(QueryLog.latency).label("avg_latency"),
+        ).filter(*window).group_by(QueryLog.topic_id).order_by(count.desc())
+
+        if k is not None:
+            query = query.limit(k)
+
+        rows = query.all()
+        topics = {
+            topic.id: topic
+            for topic in db.query(QueryTopic).filter(QueryTopic.id.in_([row.topic_id for row in rows]))
+        }
+
+        return [
+            TopQueryTopic(
+                topic_id=row.topic_id,
+                label=topics[row.topic_id].label if row.topic_id in topics else None,
+                representative_queries=[
+                    representative["query"] for representative in topics[row.topic_id].representative_queries
+                ] if row.topic_id in topics else [],
+                count=row.count,
+                share=row.count / total_count * 100,
+                success_rate=(row.success_rate or 0.0) * 100,
+                avg_latency=row.avg_latency if row.avg_latency is not None else -1.0,
+            ) for row in rows
+        ]
+
+    return cached_analytics(request, ("query-topics", k, start_date, end_date, topics_version), end_date, compute)
 
 # Endpoint to get top K similar documents for a given query
 @app.post("/top-similar-documents/", response_model=list[TopSimilarDocument])
-async def get_top_similar_documents(query: TopKSimilarDocumentQuery, db: Session = Depends(get_db)):
+def get_top_similar_documents(query: TopKSimilarDocumentQuery, db: Session = Depends(get_db)):
     """Get top K similar documents for a given query."""
     k = query.k
     query = query.query
@@ -167,10 +308,13 @@ async def get_top_similar_documents(query: TopKSimilarDocumentQuery, db: Session
     if k is not None and k <= 0:
         raise HTTPException(status_code=400, detail="K must be a positive integer")
 
-    response = ingestor.search_documents(
-        query=query,
-        k=k,
-    )
+    try:
+        response = ingestor.search_documents(
+            query=query,
+            k=k,
+        )
+    except AdmissionError as e:
+        raise admission_error_response(e)
 
     if not response:
         raise HTTPException(status_code=404, detail="No similar documents found")
@@ -179,7 +323,7 @@ async def get_top_similar_documents(query: TopKSimilarDocumentQuery, db: Session
 
 # Endpoint to get LLM response success rates and latency for a day or timeframe
 @app.post("/llm-response-metrics/", response_model=LLMResponseMetrics)
-async def get_llm_response_metrics(timeframe: Timeframe, db: Session = Depends(get_db)):
+async def get_llm_response_metrics(timeframe: Timeframe, request: Request, db: Session = Depends(get_db)):
     """Get LLM response success rates and latency for a day or timeframe."""
     start_date = timeframe.start_date
     end_date = timeframe.end_date
@@ -193,60 +337,115 @@ async def get_llm_response_metrics(timeframe: Timeframe, db: Session = Depends(g
     if end_date is None:
         end_date = date.today()
 
-    success_count = db.query(func.count(QueryLog.id)).filter(
-        QueryLog.success == True,
-        QueryLog.timestamp >= start_date,
-        QueryLog.timestamp <= end_date + timedelta(days=1)
-    ).scalar()
+    def compute():
+        success_count = db.query(func.count(QueryLog.id)).filter(
+            QueryLog.success == True,
+            QueryLog.timestamp >= start_date,
+            QueryLog.timestamp <= end_date + timedelta(days=1)
+        ).scalar()
 
-    failure_count = db.query(func.count(QueryLog.id)).filter(
-        QueryLog.success == False,
-        QueryLog.timestamp >= start_date,
-        QueryLog.timestamp <= end_date + timedelta(days=1)
-    ).scalar()
+        failure_count = db.query(func.count(QueryLog.id)).filter(
+            QueryLog.success == False,
+            QueryLog.timestamp >= start_date,
+            QueryLog.timestamp <= end_date + timedelta(days=1)
+        ).scalar()
 
-    total_count = success_count + failure_count
+        total_count = success_count + failure_count
 
-    if total_count == 0:
-        success_rate = 0.0
-    else:
-        success_rate = (success_count / total_count) * 100
+        if total_count == 0:
+            success_rate = 0.0
+        else:
+            success_rate = (success_count / total_count) * 100
 
-    avg_latency = db.query(func.avg(QueryLog.latency)).filter(
-        QueryLog.timestamp >= start_date,
-        QueryLog.timestamp <= end_date + timedelta(days=1)
-    ).scalar()
+        avg_latency = db.query(func.avg(QueryLog.latency)).filter(
+            QueryLog.timestamp >= start_date,
+            QueryLog.timestamp <= end_date + timedelta(days=1)
+        ).scalar()
 
-    if avg_latency is None:
-        avg_latency = -1.0  # Indicate no data available
+        if avg_latency is None:
+            avg_latency = -1.0  # Indicate no data available
 
-    return LLMResponseMetrics(
-        success_rate=success_rate,
-        avg_latency=avg_latency
-    )
+        return LLMResponseMetrics(
+            success_rate=success_rate,
+            avg_latency=avg_latency
+        )
+
+    return cached_analytics(request, ("llm-response-metrics", start_date, end_date), end_date, compute)
+
+@app.get("/llm-response-metrics/", response_model=LLMResponseMetrics)
+async def get_llm_response_metrics_conditional(request: Request, timeframe: Timeframe = Depends(), db: Session = Depends(get_db)):
+    """Get LLM response metrics, with the parameters in the query string to allow conditional requests."""
+    return await get_llm_response_metrics(timeframe, request, db)
 
 # Endpoint to query the query engine
 @app.post("/query/", response_model=QueryEngineResponse)
-async def query_engine_endpoint(user_query: UserQuery):
+def query_engine_endpoint(user_query: UserQuery):
     """Query the query engine with user's query and return response."""
     try:
         response: QueryEngineResponse = query_engine.query(user_query.query)
         return response
+    except AdmissionError as e:
+        raise admission_error_response(e)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-# Endpoint to get query logs for a specific timeframe
+# Query log searches rank the most recent matches, collected partition by partition
+def search_query_logs(db: Session, matches, rank, start_date: date, end_date: date, offset: int, k: Optional[int]) -> list:
+    """
+    Rank the most recent matches of a query log search, QUERY_LOG_SEARCH_CANDIDATES by default,
+    and return the requested page of them as (log, rank) pairs.
+
+    The matches are collected one monthly partition at a time, newest first, until there are
+    enough: the planner then searches each partition with the plan that suits the term, its
+    search index for rare terms and its timestamp index for common ones. Over all partitions
+    at once, it walks the timestamp index of each, past hundreds of thousands of logs for a
+    term in a fraction of a percent of them.
+    """
+    limit = max(QUERY_LOG_SEARCH_CANDIDATES, offset + (k or 0))
+    end = end_date + timedelta(days=1)
+    months = [month for month in list_partition_months(db.connection(), "query_logs") if month_start(start_date) <= month <= end]
+    candidates = []
+    for month in reversed(months):
+        candidates += matches.filter(
+            QueryLog.timestamp >= month,
+            QueryLog.timestamp < add_months(month, 1)
+        ).with_entities(QueryLog.id, QueryLog.timestamp, rank.label("rank")).order_by(
+            QueryLog.timestamp.desc(), QueryLog.id.desc()
+        ).limit(limit - len(candidates)).all()
+        if len(candidates) >= limit:
+            break
+
+    # Most relevant first, then newest first
+    candidates.sort(key=lambda candidate: (candidate.rank, candidate.timestamp, candidate.id), reverse=True)
+    page = candidates[offset:] if k is None else candidates[offset:offset + k]
+    if not page:
+        return []
+    logs = db.query(QueryLog).filter(
+        tuple_(QueryLog.id, QueryLog.timestamp).in_([(candidate.id, candidate.timestamp) for candidate in page])
+    ).all()
+    logs_by_key = {(log.id, log.timestamp): log for log in logs}
+    return [(logs_by_key[(candidate.id, candidate.timestamp)], candidate.rank) for candidate in page]
+
+# Endpoint to get and search query logs for a specific timeframe
 @app.post("/query-logs/", response_model=list[QueryLogOutput | None])
 async def get_query_logs(query: QueryLogInput, db: Session = Depends(get_db)):
-    """Get query logs for a specific timeframe."""
+    """
+    Get query logs for a specific timeframe, newest first. With a search, get the most recent
+    QUERY_LOG_SEARCH_CANDIDATES matches (2000 by default), ranked by relevance: older matches
+    are left out even if they would rank higher, so narrow the timeframe to search further back.
+    """
     start_date = query.start_date
     end_date = query.end_date
     k = query.k
     include_citations = query.include_citations
     include_errors = query.include_errors
+    search = (query.search or "").strip()
+    offset = query.offset or 0
 
     if k is not None and k <= 0:
         raise HTTPException(status_code=400, detail="K must be a positive integer")
+    if offset < 0:
+        raise HTTPException(status_code=400, detail="Offset must be a non-negative integer")
         
     if start_date is None:
         # If start_date is None, get all records up to end_date
@@ -262,10 +461,34 @@ async def get_query_logs(query: QueryLogInput, db: Session = Depends(get_db)):
         QueryLog.timestamp <= end_date + timedelta(days=1)
     )
 
-    if k is not None:
-        logs = logs.limit(k)
-    
-    logs = logs.all()
+    if not include_errors:
+        logs = logs.filter(QueryLog.success == True)
+
+    if search and query.fuzzy:
+        # Trigram word similarity, so misspelled terms still match
+        search_text = literal_column(f"({QUERY_LOG_SEARCH_TEXT})")
+        rank = func.word_similarity(search, search_text)
+        logs = logs.filter(literal(search).bool_op("<%")(search_text))
+    elif search:
+        # Full-text search, supporting quoted phrases, `or` and `-` exclusions
+        ts_query = func.websearch_to_tsquery("english", search)
+        rank = func.ts_rank_cd(QueryLog.search_vector, ts_query)
+        logs = logs.filter(QueryLog.search_vector.bool_op("@@")(ts_query))
+    else:
+        rank = literal(None)
+
+    try:
+        if search:
+            logs = search_query_logs(db, logs, rank, start_date, end_date, offset, k)
+        else:
+            logs = logs.add_columns(rank.label("rank")).order_by(QueryLog.timestamp.desc(), QueryLog.id.desc()).offset(offset)
+            if k is not None:
+                logs = logs.limit(k)
+            logs = logs.all()
+    except ProgrammingError:
+        if not query.fuzzy:
+            raise
+        raise HTTPException(status_code=400, detail="Fuzzy search requires the pg_trgm extension")
 
     if not logs:
         return []
@@ -278,33 +501,56 @@ async def get_query_logs(query: QueryLogInput, db: Session = Depends(get_db)):
             latency=log.latency,
             success=log.success,
             error=log.error,
+            prompt_tokens=log.prompt_tokens,
             timestamp=log.timestamp,
+            rank=rank,
             citations=[],
-        ) for log in logs
+        ) for log, rank in logs
     ]
 
-    if not include_errors:
-        logs = [log for log in logs if log.success]
-
     if include_citations:
-        for log in logs:
-            citations = db.query(CitedDocument).filter(CitedDocument.query_log_id == log.id).all()
+        # Get the citations of every log of the page, and their content, at once
+        citations = db.query(CitedDocument).filter(
+            tuple_(CitedDocument.query_log_id, CitedDocument.timestamp).in_([(log.id, log.timestamp) for log in logs])
+        ).order_by(CitedDocument.id).all()
 
-            if not citations:
-                continue
-
-            # Get content for each citation
-            node_ids = [doc.node_id for doc in citations]
+        if citations:
             response = ingestor.get_nodes_content(
-                node_ids=node_ids
+                node_ids=list(dict.fromkeys(doc.node_id for doc in citations))
             )
-
-            log.citations = [
-                Citation(
+            logs_by_key = {(log.id, log.timestamp): log for log in logs}
+            for doc in citations:
+                logs_by_key[(doc.query_log_id, doc.timestamp)].citations.append(Citation(
                     file_path=doc.file_path,
                     score=doc.score,
                     content=response[doc.node_id]
-                ) for doc in citations
-            ]
-
-    return logs
\ No newline at end of file
+                ))
+
+    return logs
+
+
+# Endpoint to get hit ratio and memory usage of the in-process caches
+@app.get("/cache-stats/", response_model=dict[str, CacheStats])
+async def get_cache_stats():
+    """Get hit ratio and memory usage of the in-process caches."""
+    return {
+        "node_content": CacheStats(**ingestor.node_cache.stats()),
+        "analytics_results": CacheStats(**analytics_cache.stats()),
+    }
+
+# Endpoint to get queue depth, rejections and circuit breaker state of the LLM and embedding calls
+@app.get("/admission-stats/", response_model=dict[str, AdmissionStats])
+async def get_admission_stats():
+    """Get queue depth, rejections and circuit breaker state of the LLM and embedding calls."""
+    return {
+        "llm": AdmissionStats(**query_engine.llm_admission.stats()),
+        "embedding": AdmissionStats(**ingestor.embedding_admission.stats()),
+    }
+
+# Endpoint to get the size and refreshes of the in-process vector store replica
+@app.get("/vector-replica-stats/", response_model=VectorReplicaStats)
+async def get_vector_replica_stats():
+    """Get the size, version and refreshes of the in-process vector store replica, if enabled."""
+    if ingestor.vector_replica is None:
+        return VectorReplicaStats(enabled=False, loaded=False, rows=0, embedding_bytes=0, terms=0, refreshes=0, queries=0, fallbacks=0)
+    return VectorReplicaStats(enabled=True, **ingestor.vector_replica.stats())
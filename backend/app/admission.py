@@ -0,0 +1,197 @@
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from typing import Any, Callable
+import math
+import threading
+import time
+
+class AdmissionError(Exception):
+    """Raised when a call to an external provider is not admitted or does not finish in time."""
+
+    def __init__(self, message: str, retry_after: int = 1):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+class QueueFullError(AdmissionError):
+    pass
+
+class CircuitOpenError(AdmissionError):
+    pass
+
+class DeadlineExceededError(AdmissionError):
+    pass
+
+# Create CircuitBreaker class to stop calling a provider while it is failing
+class CircuitBreaker:
+    """
+    Consecutive-failure circuit breaker.
+
+    After `failure_threshold` consecutive failures the breaker opens, and calls are
+    rejected for `reset_timeout` seconds. It then lets a single trial call through
+    (half-open), which closes the breaker on success or re-opens it on failure.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    def before_call(self):
+        """
+        Check whether a call may proceed, raising `CircuitOpenError` if not.
+        """
+        with self._lock:
+            if self.state == self.CLOSED:
+                return
+            remaining = self._opened_at + self.reset_timeout - time.monotonic()
+            if self.state == self.OPEN and remaining <= 0:
+                self.state = self.HALF_OPEN
+            if self.state == self.HALF_OPEN and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return
+            raise CircuitOpenError(
+                "The provider is failing, calls are suspended.",
+                retry_after=max(math.ceil(remaining), 1),
+            )
+
+    def cancel_call(self):
+        """
+        Release a call admitted by `before_call` that never reached the provider.
+        """
+        with self._lock:
+            self._trial_in_flight = False
+
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self.consecutive_failures = 0
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.consecutive_failures += 1
+            if self.state == self.HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+                self.state = self.OPEN
+                self._opened_at = time.monotonic()
+            self._trial_in_flight = False
+
+# Create AdmissionController class to bound concurrent calls to a provider
+class AdmissionController:
+    """
+    Bound the concurrent calls to an external provider (LLM or embedding model).
+
+    At most `max_concurrency` calls run at once, on the controller's own threads,
+    and at most `max_queue` callers wait for a free slot; further callers are
+    rejected right away with `QueueFullError`. Every call has a deadline of
+    `timeout` seconds, including its time in the queue. A call that misses its
+    deadline keeps its slot until the provider returns, so a slow provider cannot
+    pile up more than `max_concurrency` outstanding calls.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        max_concurrency: int,
+        max_queue: int,
+        timeout: float,
+        breaker: CircuitBreaker,
+    ):
+        self.name = name
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self.breaker = breaker
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix=f"{name}-admission")
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.queue_depth = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.timeouts = 0
+        self.failures = 0
+        self._avg_latency = 1.0
+
+    def _release(self, started_at: float):
+        with self._lock:
+            self.in_flight -= 1
+            # Exponential moving average of the provider latency, used for `Retry-After`
+            self._avg_latency = 0.8 * self._avg_latency + 0.2 * (time.monotonic() - started_at)
+        self._slots.release()
+
+    def _acquire(self, deadline: float):
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                if self.queue_depth >= self.max_queue:
+                    self.rejected += 1
+                    retry_after = math.ceil(self._avg_latency * (self.queue_depth + 1) / self.max_concurrency)
+                    raise QueueFullError(f"Too many pending {self.name} calls.", retry_after=max(retry_after, 1))
+                self.queue_depth += 1
+            try:
+                acquired = self._slots.acquire(timeout=max(deadline - time.monotonic(), 0))
+            finally:
+                with self._lock:
+                    self.queue_depth -= 1
+            if not acquired:
+                with self._lock:
+                    self.timeouts += 1
+                raise DeadlineExceededError(f"Timed out waiting for a free {self.name} slot.")
+        with self._lock:
+            self.in_flight += 1
+            self.admitted += 1
+
+    def call(self, fn: Callable, *args, **kwargs) -> Any:
+        """
+        Run `fn(*args, **kwargs)` within the concurrency limit and deadline.
+        """
+        deadline = time.monotonic() + self.timeout
+        self.breaker.before_call()
+        try:
+            self._acquire(deadline)
+        except AdmissionError:
+            self.breaker.cancel_call()
+            raise
+
+        started_at = time.monotonic()
+        future = self._executor.submit(fn, *args, **kwargs)
+        future.add_done_callback(lambda _: self._release(started_at))
+        try:
+            result = future.result(timeout=max(deadline - time.monotonic(), 0))
+        except FutureTimeoutError:
+            with self._lock:
+                self.timeouts += 1
+            self.breaker.record_failure()
+            raise DeadlineExceededError(f"The {self.name} call did not finish within {self.timeout}s.")
+        except Exception:
+            with self._lock:
+                self.failures += 1
+            self.breaker.record_failure()
+            raise
+        self.breaker.record_success()
+        return result
+
+    def stats(self) -> dict:
+        """
+        Return the queue depth, rejections and breaker state of the controller.
+        """
+        with self._lock:
+            return {
+                "max_concurrency": self.max_concurrency,
+                "max_queue": self.max_queue,
+                "timeout": self.timeout,
+                "in_flight": self.in_flight,
+                "queue_depth": self.queue_depth,
+                "admitted": self.admitted,
+                "rejected": self.rejected,
+                "timeouts": self.timeouts,
+                "failures": self.failures,
+                "breaker_state": self.breaker.state,
+                "breaker_consecutive_failures": self.breaker.consecutive_failures,
+            }
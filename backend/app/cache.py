@@ -0,0 +1,158 @@
+from collections import OrderedDict
+from typing import Any, Hashable, Optional
+import sys
+import threading
+import time
+
+# Create LRUCache class shared by the in-process caches
+class LRUCache:
+    """
+    Thread-safe LRU cache bounded by an approximate byte budget, with optional TTLs.
+
+    The cache is bounded by bytes rather than an entry count, since cached values
+    vary widely in size. Entries may belong to a group, so that related entries
+    can be invalidated together.
+    """
+
+    def __init__(self, max_bytes: int, ttl: Optional[float] = None):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        # key -> (value, group, expires_at, size)
+        self._entries: OrderedDict[Hashable, tuple[Any, Optional[Hashable], Optional[float], int]] = OrderedDict()
+        self._groups: dict[Hashable, set[Hashable]] = {}
+        self._lock = threading.Lock()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def _entry_size(key: Hashable, value: Any) -> int:
+        return sys.getsizeof(key) + sys.getsizeof(value)
+
+    def _remove(self, key: Hashable):
+        _, group, _, size = self._entries.pop(key)
+        self._bytes -= size
+        if group is not None:
+            keys = self._groups.get(group)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._groups[group]
+
+    def _lookup(self, key: Hashable, now: float) -> Optional[Any]:
+        entry = self._entries.get(key)
+        if entry is not None and entry[2] is not None and now > entry[2]:
+            self._remove(key)
+            entry = None
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._entries.move_to_end(key)
+        return entry[0]
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            return self._lookup(key, time.monotonic())
+
+    def get_many(self, keys: list[Hashable]) -> tuple[dict, list]:
+        """
+        Look up several keys at once, and return the cached values and the missing keys.
+        """
+        found = dict()
+        missing = []
+        now = time.monotonic()
+        with self._lock:
+            for key in keys:
+                value = self._lookup(key, now)
+                if value is None:
+                    missing.append(key)
+                else:
+                    found[key] = value
+        return found, missing
+
+    def put(self, key: Hashable, value: Any, ttl: Optional[float] = None, group: Optional[Hashable] = None):
+        """
+        Add or replace an entry, evicting the least recently used entries if needed.
+        """
+        size = self._entry_size(key, value)
+        ttl = ttl if ttl is not None else self.ttl
+        expires_at = time.monotonic() + ttl if ttl is not None else None
+        with self._lock:
+            # Drop the previous value first, so a value too large to cache does not leave it stale
+            if key in self._entries:
+                self._remove(key)
+            if size > self.max_bytes:
+                return
+            self._entries[key] = (value, group, expires_at, size)
+            self._bytes += size
+            if group is not None:
+                self._groups.setdefault(group, set()).add(key)
+            while self._bytes > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.evictions += 1
+
+    def invalidate_group(self, group: Hashable):
+        """
+        Drop every cached entry that belongs to the given group.
+        """
+        with self._lock:
+            for key in list(self._groups.get(group, ())):
+                self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._groups.clear()
+            self._bytes = 0
+
+    def stats(self) -> dict:
+        """
+        Return hit ratio and memory usage of the cache.
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+            }
+
+# Create NodeContentCache class to keep cleaned node content in memory
+class NodeContentCache(LRUCache):
+    """
+    Cache of `node_id -> cleaned content`, grouped by the node's `ref_doc_id`,
+    so all nodes of a document can be invalidated when it is upserted or deleted.
+    """
+
+    def put(self, node_id: str, content: str, ref_doc_id: Optional[str] = None):
+        super().put(node_id, content, group=ref_doc_id)
+
+    def invalidate_document(self, ref_doc_id: str):
+        self.invalidate_group(ref_doc_id)
+
+# Create ResultCache class to keep serialized analytics responses in memory
+class ResultCache(LRUCache):
+    """
+    Cache of `normalized request parameters -> (etag, JSON body, expiry)`, with
+    a TTL chosen per entry by the caller.
+    """
+
+    @staticmethod
+    def _entry_size(key: Hashable, value: tuple[str, bytes, float]) -> int:
+        etag, body, _ = value
+        return sys.getsizeof(key) + sys.getsizeof(etag) + sys.getsizeof(body)
+
+    def get_result(self, key: Hashable) -> Optional[tuple[str, bytes, float]]:
+        return self.get(key)
+
+    def put_result(self, key: Hashable, etag: str, body: bytes, ttl: float) -> tuple[str, bytes, float]:
+        result = (etag, body, time.time() + ttl)
+        self.put(key, result, ttl=ttl)
+        return result
@@ -0,0 +1,81 @@
+from llama_index.core import Settings
+from llama_index.core.postprocessor.types import BaseNodePostprocessor
+from llama_index.core.query_engine.citation_query_engine import CITATION_QA_TEMPLATE
+from llama_index.core.schema import MetadataMode, NodeWithScore, QueryBundle
+from typing import Optional
+import re
+
+def _shingles(text: str, size: int = 3) -> set[tuple[str, ...]]:
+    """
+    Split a text into its set of word shingles, used to detect near-identical chunks.
+    """
+    words = re.findall(r"\w+", text.lower())
+    if len(words) < size:
+        return {tuple(words)}
+    return {tuple(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+def _jaccard(a: set, b: set) -> float:
+    if not a and not b:
+        return 1.0
+    return len(a & b) / len(a | b)
+
+def count_prompt_tokens(query_text: str, source_nodes: list[NodeWithScore]) -> int:
+    """
+    Count the tokens of the citation QA prompt built from the given source nodes.
+    """
+    context_str = "\n\n".join(
+        node.node.get_content(metadata_mode=MetadataMode.NONE) for node in source_nodes
+    )
+    prompt = CITATION_QA_TEMPLATE.format(context_str=context_str, query_str=query_text)
+    return len(Settings.tokenizer(prompt))
+
+# Create ContextPacker class to assemble the context sent to the LLM
+class ContextPacker(BaseNodePostprocessor):
+    """
+    Assemble the retrieved nodes into the LLM context:
+    - drop nodes scoring below `score_threshold`
+    - drop nodes near-identical to a better scoring node of the same `file_path`
+    - pack the remaining nodes, best first, into `token_budget` tokens
+    The best scoring node is always kept, even if it alone exceeds the budget.
+    """
+
+    score_threshold: float = 0.0
+    dedup_threshold: float = 0.9
+    token_budget: int = 2048
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "ContextPacker"
+
+    def _postprocess_nodes(
+        self,
+        nodes: list[NodeWithScore],
+        query_bundle: Optional[QueryBundle] = None,
+    ) -> list[NodeWithScore]:
+        candidates = [
+            node for node in nodes
+            if node.score is None or node.score >= self.score_threshold
+        ]
+        candidates.sort(key=lambda node: node.score or 0.0, reverse=True)
+
+        packed = []
+        used_tokens = 0
+        seen_shingles: dict[Optional[str], list[set]] = {}
+        for node in candidates:
+            content = node.node.get_content(metadata_mode=MetadataMode.NONE)
+
+            # Skip near-duplicates of an already packed chunk from the same file
+            file_path = node.node.metadata.get("file_path")
+            shingles = _shingles(content)
+            if any(_jaccard(shingles, other) >= self.dedup_threshold for other in seen_shingles.get(file_path, [])):
+                continue
+
+            tokens = len(Settings.tokenizer(content))
+            if packed and used_tokens + tokens > self.token_budget:
+                continue
+
+            packed.append(node)
+            used_tokens += tokens
+            seen_shingles.setdefault(file_path, []).append(shingles)
+
+        return packed
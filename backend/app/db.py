@@ -1,6 +1,5 @@
-from llama_index.vector_stores.postgres import PGVectorStore
 from llama_index.storage.docstore.mongodb import MongoDocumentStore
-from llama_index.core import SimpleDirectoryReader, VectorStoreIndex, StorageContext
+from llama_index.core import SimpleDirectoryReader, VectorStoreIndex, StorageContext, Settings, QueryBundle
 from llama_index.core.ingestion import IngestionPipeline
 from llama_index.readers.file import PyMuPDFReader, MarkdownReader, PandasCSVReader
 from llama_index.core.query_engine import CitationQueryEngine
@@ -15,13 +14,28 @@ from sqlalchemy import (
     DateTime, 
     Boolean, 
     Index,
-    ForeignKey
+    FetchedValue,
 )
+from sqlalchemy.dialects.postgresql import TSVECTOR, JSONB
+from pgvector.sqlalchemy import Vector
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker, relationship
+from sqlalchemy.orm import sessionmaker, relationship, backref, deferred
 from datetime import datetime, timezone
 from typing import Optional, Any
 from .models import Citation, QueryEngineResponse, TopSimilarDocument
+from .cache import NodeContentCache
+from .context import ContextPacker, count_prompt_tokens
+from .vector_store import QuantizedPGVectorStore, HNSW_KWARGS
+from .replica import VectorReplica, bump_version
+from .admission import AdmissionController, AdmissionError, CircuitBreaker, DeadlineExceededError
+from .schema import (
+    upgrade_schema,
+    apply_retention_from_env,
+    ensure_partitions,
+    month_start,
+    add_months,
+    QUERY_EMBEDDING_DIM,
+)
 import os
 import time
 import logging
@@ -37,13 +51,21 @@ Base = declarative_base()
 class QueryLog(Base):
     __tablename__ = "query_logs"
 
-    id = Column(Integer, primary_key=True)
+    # The table is partitioned by month on `timestamp`, see `schema.upgrade_schema`
+    id = Column(Integer, primary_key=True, autoincrement=True)
     query = Column(String)
     response = Column(String)
     latency = Column(Float)
     success = Column(Boolean)
     error = Column(String)
-    timestamp = Column(DateTime, default=datetime.now(timezone.utc))
+    prompt_tokens = Column(Integer)
+    timestamp = Column(DateTime, primary_key=True, default=lambda: datetime.now(timezone.utc))
+    # Only read by full-text search filters, so not loaded with the logs; set by a trigger and
+    # indexed as created by `schema.upgrade_schema`
+    search_vector = deferred(Column(TSVECTOR, server_default=FetchedValue(), server_onupdate=FetchedValue()))
+    # Embedding of the query, clustered into topics by `topics.update_topics`
+    embedding = deferred(Column(Vector(QUERY_EMBEDDING_DIM)))
+    topic_id = Column(Integer)
 
     Index('query_logs_timestamp_idx', timestamp)
     Index('query_logs_success_idx', success)
@@ -55,17 +77,42 @@ class QueryLog(Base):
 class CitedDocument(Base):
     __tablename__ = "cited_documents"
 
-    id = Column(Integer, primary_key=True)
+    # The table is partitioned by month on `timestamp`, the timestamp of its query log
+    id = Column(Integer, primary_key=True, autoincrement=True)
     file_path = Column(String)
     node_id = Column(String)
     score = Column(Float)
-    query_log_id = Column(Integer, ForeignKey('query_logs.id'))
+    query_log_id = Column(Integer)
+    timestamp = Column(DateTime, primary_key=True)
+
+    Index('cited_documents_query_log_idx', query_log_id, timestamp)
 
-    query_log = relationship("QueryLog", backref="cited_documents")
+    # Partitioned tables can't have a foreign key detached along with old partitions, so join explicitly
+    query_log = relationship(
+        "QueryLog",
+        primaryjoin="and_(foreign(CitedDocument.query_log_id) == QueryLog.id, foreign(CitedDocument.timestamp) == QueryLog.timestamp)",
+        backref=backref("cited_documents", viewonly=True),
+        viewonly=True,
+    )
 
     def __repr__(self):
         return f"<CitedDocument(file_path='{self.file_path}', node_id='{self.node_id}', score={self.score})>"
 
+# Define the QueryTopic class
+class QueryTopic(Base):
+    __tablename__ = "query_topics"
+
+    # Created by `schema.upgrade_schema` and updated by `topics.update_topics`
+    id = Column(Integer, primary_key=True)
+    centroid = deferred(Column(Vector(QUERY_EMBEDDING_DIM), nullable=False))
+    size = Column(Integer, nullable=False, default=0)
+    label = Column(String)
+    representative_queries = Column(JSONB, nullable=False, default=list)
+    updated_at = Column(DateTime)
+
+    def __repr__(self):
+        return f"<QueryTopic(id={self.id}, label='{self.label}', size={self.size})>"
+
 # Create Ingestor class to handle file reading and vector store operations
 class Ingestor:
     def __init__(self):
@@ -76,8 +123,10 @@ class Ingestor:
         self.temp_dir = os.getenv("TEMP_DIR")
         url = make_url(self.connection_string)
 
-        # Create a PGVectorStore instance using the connection string
-        self.vector_store = PGVectorStore.from_params(
+        # Create a PGVectorStore instance using the connection string, whose HNSW index holds
+        # float32, half precision or binary quantized embeddings (see migrate_vector_storage.py)
+        rerank_factor = os.getenv("VECTOR_RERANK_FACTOR")
+        self.vector_store = QuantizedPGVectorStore.from_params(
             database=self.db_name,
             host=url.host,
             password=url.password,
@@ -86,14 +135,29 @@ class Ingestor:
             table_name="support_docs",
             embed_dim=768,
             hybrid_search=True,
-            hnsw_kwargs={
-                "hnsw_m": 16,
-                "hnsw_ef_construction": 64,
-                "hnsw_ef_search": 40,
-                "hnsw_dist_method": "vector_cosine_ops",
-            },
+            # PGVectorStore consumes the build parameters, so pass a copy
+            hnsw_kwargs=dict(HNSW_KWARGS),
+            storage_mode=os.getenv("VECTOR_STORAGE_MODE", "float32"),
+            rerank_factor=int(rerank_factor) if rerank_factor else None,
         )
 
+        # Engine of the database holding the vector store, whose version counter tells replicas to refresh
+        self.vector_store_engine = create_engine(url.set(database=self.db_name))
+        self.vector_table_name = f"data_{self.vector_store.table_name}"
+
+        # Optionally serve retrieval from an in-process replica of the vector store, kept in sync with Postgres
+        self.vector_replica = None
+        if os.getenv("VECTOR_REPLICA", "false").lower() == "true":
+            self.vector_replica = VectorReplica(
+                engine=self.vector_store_engine,
+                table_name=self.vector_table_name,
+                embed_dim=768,
+                refresh_interval=float(os.getenv("VECTOR_REPLICA_REFRESH_INTERVAL", 5)),
+                sparse_ranking=os.getenv("VECTOR_REPLICA_SPARSE_RANKING", "ts_rank"),
+            )
+            self.vector_store.attach_replica(self.vector_replica)
+            self.vector_replica.refresh(force=True)  # Load it before serving requests
+
         # Create a MongoDocumentStore instance for document storage
         self.document_store = MongoDocumentStore.from_uri(
             uri=self.mongo_uri,
@@ -121,8 +185,35 @@ class Ingestor:
 
         # Database engine and session
         self.engine = create_engine(self.connection_string)
+        upgrade_schema(self.engine)  # Create or migrate the partitioned query log tables
         Base.metadata.create_all(self.engine)  # Create tables if they don't exist
         self.Session = sessionmaker(bind=self.engine)
+        self.partitioned_months = set()
+
+        # Bound the concurrent embedding calls made by document searches
+        self.embedding_admission = AdmissionController(
+            name="embedding",
+            max_concurrency=int(os.getenv("EMBEDDING_MAX_CONCURRENCY", 8)),
+            max_queue=int(os.getenv("EMBEDDING_MAX_QUEUE", 8)),
+            timeout=float(os.getenv("EMBEDDING_TIMEOUT", 10)),
+            breaker=CircuitBreaker(
+                failure_threshold=int(os.getenv("BREAKER_FAILURE_THRESHOLD", 5)),
+                reset_timeout=float(os.getenv("BREAKER_RESET_TIMEOUT", 30)),
+            ),
+        )
+
+        # Archive or drop query log partitions past the retention period. manage_query_log_partitions.py
+        # is the main path for this, so a failure here is logged rather than keeping the app from starting
+        try:
+            apply_retention_from_env(self.engine)
+        except Exception as e:
+            logger.error(f"Error applying the query log retention policy: {e}")
+
+        # In-memory cache of cleaned node content, used to hydrate citations
+        self.node_cache = NodeContentCache(
+            max_bytes=int(os.getenv("NODE_CACHE_MAX_BYTES", 32 * 1024 * 1024)),
+            ttl=float(os.getenv("NODE_CACHE_TTL", 3600)),
+        )
 
     def load_data(self):
         """
@@ -148,12 +239,31 @@ class Ingestor:
                 doc.metadata["file_path"] = os.path.abspath(doc.metadata["file_path"])
                 doc.metadata["file_path"] = os.path.relpath(doc.metadata["file_path"], self.temp_dir)
 
+            # Invalidate cached nodes of documents that the pipeline will upsert
+            for doc in documents:
+                existing_hash = self.document_store.get_document_hash(doc.doc_id)
+                if existing_hash and existing_hash != doc.hash:
+                    self.node_cache.invalidate_document(doc.doc_id)
+
             # Run the ingestion pipeline to add documents to the vector store
-            self.ingestion_pipeline.run(
+            nodes = self.ingestion_pipeline.run(
                 documents=documents,
                 show_progress=True,
             )
 
+            # Let the replicas of the vector store pick up the changes, this process's right away
+            bump_version(self.vector_store_engine, self.vector_table_name)
+            if self.vector_replica is not None:
+                self.vector_replica.refresh(force=True)
+
+            # Warm the node cache with the freshly ingested nodes
+            for node in nodes:
+                self.node_cache.put(
+                    node.node_id,
+                    node.get_content().replace("\r", ""),
+                    ref_doc_id=node.ref_doc_id,
+                )
+
             logger.info(f"Loaded {len(documents)} documents into the vector store.")
         except Exception as e:
             logger.error(f"Error loading data: {e}")
@@ -165,19 +275,36 @@ class Ingestor:
                 if os.path.isfile(file_path):
                     os.remove(file_path)
 
-    def log_query(self, query: str, response: str, latency: float, success: bool, error: str = None) -> int:
+    def ensure_partition(self, timestamp: datetime):
+        """
+        Make sure the monthly partitions for a timestamp exist before writing to them.
+        """
+        month = month_start(timestamp.date())
+        if month in self.partitioned_months:
+            return
+        with self.engine.begin() as connection:
+            # Include the neighbouring months, in case the database session's time zone shifts the timestamp
+            ensure_partitions(connection, add_months(month, -1), add_months(month, 1))
+        self.partitioned_months.add(month)
+
+    def log_query(self, query: str, response: str, latency: float, success: bool, error: str = None, prompt_tokens: int = None, timestamp: datetime = None, embedding: list[float] = None) -> int:
         """
         Log a query and its response to the database, and return the log's ID.
         """
         session = self.Session()
         log_id = None
+        timestamp = timestamp or datetime.now(timezone.utc)
         try:
+            self.ensure_partition(timestamp)
             log = QueryLog(
                 query=query,
                 response=response,
                 latency=latency,
                 success=success,
                 error=error,
+                prompt_tokens=prompt_tokens,
+                timestamp=timestamp,
+                embedding=embedding,
             )
             session.add(log)
             session.commit()
@@ -191,9 +318,9 @@ class Ingestor:
         
         return log_id
     
-    def store_cited_document(self, file_path: str, node_id: str, score: float, query_log_id: int):
+    def store_cited_document(self, file_path: str, node_id: str, score: float, query_log_id: int, query_log_timestamp: datetime):
         """
-        Store a cited document in the database.
+        Store a cited document in the database, in the partition of its query log.
         """
         session = self.Session()
         try:
@@ -202,6 +329,7 @@ class Ingestor:
                 node_id=node_id,
                 score=score,
                 query_log_id=query_log_id,
+                timestamp=query_log_timestamp,
             )
             session.add(cited_doc)
             session.commit()
@@ -227,38 +355,56 @@ class Ingestor:
     def get_nodes_content(self, node_ids: list[str]) -> Optional[dict]:
         """
         Retrieve the content of a node from the vector store using its ID.
+        Content is served from the node cache where possible.
         """
         try:
-            nodes = self.get_nodes(node_ids=node_ids)
+            response, missing = self.node_cache.get_many(node_ids)
+            if not missing:
+                return response
+            nodes = self.get_nodes(node_ids=missing)
             if nodes is None:
                 return None
-            response = dict()
             for node in nodes:
                 content = node.get_content()
                 # Remove `\r`
                 content = content.replace("\r", "")
                 response[node.node_id] = content
+                self.node_cache.put(node.node_id, content, ref_doc_id=node.ref_doc_id)
             return response
         except Exception as e:
             logger.error(f"Error retrieving node content: {e}")
             return None
         
+    @staticmethod
+    def embed_query(query_bundle: QueryBundle) -> QueryBundle:
+        """
+        Compute the embedding of a query once, so retrieval reuses it and it can be logged.
+        """
+        if query_bundle.embedding is None:
+            query_bundle.embedding = Settings.embed_model.get_query_embedding(query_bundle.query_str)
+        return query_bundle
+
     def search_documents(self, query: str, k: int = 5) -> list[TopSimilarDocument]:
         """
         Search for documents in the vector store using a query text.
         """
         start_time = time.time()
+        timestamp = datetime.now(timezone.utc)
         success = False
         error = None
         results = []
         retrieved_nodes = []
         
+        deadline_error = None
+        query_bundle = QueryBundle(query_str=query)
         try:
             retriever = self.index.as_retriever(
                 similarity_top_k=k,
                 vector_store_query_mode="hybrid"
             )
-            retrieved_nodes = retriever.retrieve(query)
+            retrieved_nodes = self.embedding_admission.call(
+                lambda: retriever.retrieve(self.embed_query(query_bundle))
+            )
             if not retrieved_nodes:
                 raise ValueError("No similar documents found.")
             results = [
@@ -271,6 +417,14 @@ class Ingestor:
             ]
             success = True
             response_text = f"Top {k} similar documents retrieved!"
+        except DeadlineExceededError as e:
+            logger.error(f"Error searching documents: {e}")
+            error = str(e)
+            response_text = f"Error searching documents: {str(e)}"
+            deadline_error = e
+        except AdmissionError:
+            # Rejected before reaching the embedding model, so there is nothing to log
+            raise
         except Exception as e:
             logger.error(f"Error searching documents: {e}")
             error = str(e)
@@ -285,7 +439,9 @@ class Ingestor:
             response=response_text,
             latency=latency,
             success=success,
-            error=error
+            error=error,
+            timestamp=timestamp,
+            embedding=query_bundle.embedding,
         )
         
         # Store the retrieved documents in the cited_documents table
@@ -295,29 +451,88 @@ class Ingestor:
                     file_path=result.node.metadata["file_path"],
                     node_id=result.node.node_id,
                     score=result.score,
-                    query_log_id=log_id
+                    query_log_id=log_id,
+                    query_log_timestamp=timestamp,
                 )
+
+        if deadline_error is not None:
+            raise deadline_error
         
         return results
 
 class QueryEngine:
-    def __init__(self, ingestor: Ingestor):
+    def __init__(self, ingestor: Ingestor, pack_context: bool = True):
         self.ingestor = ingestor
+
+        # Assemble the context sent to the LLM from the relevant, distinct chunks only
+        node_postprocessors = []
+        if pack_context:
+            node_postprocessors.append(ContextPacker(
+                score_threshold=float(os.getenv("CONTEXT_SCORE_THRESHOLD", 0.3)),
+                dedup_threshold=float(os.getenv("CONTEXT_DEDUP_THRESHOLD", 0.9)),
+                token_budget=int(os.getenv("CONTEXT_TOKEN_BUDGET", 2048)),
+            ))
+
+        # Bound the concurrent LLM calls, and stop calling the LLM while it is failing
+        self.llm_admission = AdmissionController(
+            name="llm",
+            max_concurrency=int(os.getenv("LLM_MAX_CONCURRENCY", 4)),
+            max_queue=int(os.getenv("LLM_MAX_QUEUE", 8)),
+            timeout=float(os.getenv("LLM_TIMEOUT", 30)),
+            breaker=CircuitBreaker(
+                failure_threshold=int(os.getenv("BREAKER_FAILURE_THRESHOLD", 5)),
+                reset_timeout=float(os.getenv("BREAKER_RESET_TIMEOUT", 30)),
+            ),
+        )
+
         self.query_engine = CitationQueryEngine.from_args(
             index=self.ingestor.index,
             similarity_top_k=5,
-            citation_chunk_size=1024
+            citation_chunk_size=1024,
+            node_postprocessors=node_postprocessors,
         )
 
+    @staticmethod
+    def get_cited_nodes(response: Response) -> list:
+        """
+        Get the source nodes cited in a response, by their `[n]` markers.
+        """
+        citation_indices = set()
+        pattern = r"\[(\d+)\]"  # Regex to find citation indices like [1], [2]
+        matches = re.findall(pattern, response.response)
+        for match in matches:
+            citation_indices.add(int(match) - 1) # Convert to zero-based index
+
+        # Filter cited documents based on the indices
+        return [
+            response.source_nodes[i] for i in sorted(citation_indices) if i < len(response.source_nodes)
+        ]
+
     def query(self, query_text: str) -> QueryEngineResponse:
         """
         Query the vector store and return the response.
         """
         start_time = time.time()
+        timestamp = datetime.now(timezone.utc)
+        prompt_tokens = None
+        deadline_error = None
+        query_bundle = QueryBundle(query_str=query_text)
         try:
-            response: Response = self.query_engine.query(query_text)
+            # Embed the query under the embedding controller first, so that the LLM's slots and
+            # breaker only account for the LLM, and embedding calls stay within their own bound
+            self.ingestor.embedding_admission.call(self.ingestor.embed_query, query_bundle)
+            response: Response = self.llm_admission.call(self.query_engine.query, query_bundle)
+            prompt_tokens = count_prompt_tokens(query_text, response.source_nodes)
             success = True
             error = None
+        except DeadlineExceededError as e:
+            response = None
+            success = False
+            error = str(e)
+            deadline_error = e
+        except AdmissionError:
+            # Rejected before reaching the embedding model or the LLM, so there is nothing to log
+            raise
         except Exception as e:
             response = None
             success = False
@@ -333,24 +548,21 @@ class QueryEngine:
             latency=latency,
             success=success,
             error=error,
+            prompt_tokens=prompt_tokens,
+            timestamp=timestamp,
+            embedding=query_bundle.embedding,
         )
-        logging.info(f"Response: {response.response}")
+        logging.info(f"Response: {response}")
+
+        if deadline_error is not None:
+            raise deadline_error
 
         # If the query was successful, store the cited documents
         cited_docs = []
         if success and response:
             try:
                 # Parse response to extract cited documents
-                citation_indices = set()
-                pattern = r"\[(\d+)\]"  # Regex to find citation indices like [1], [2]
-                matches = re.findall(pattern, response.response)
-                for match in matches:
-                    citation_indices.add(int(match) - 1) # Convert to zero-based index
-
-                # Filter cited documents based on the indices
-                cited_docs = [
-                    response.source_nodes[i] for i in citation_indices if i < len(response.source_nodes)
-                ]
+                cited_docs = self.get_cited_nodes(response)
                 
                 for citation in cited_docs:
                     self.ingestor.store_cited_document(
@@ -358,6 +570,7 @@ class QueryEngine:
                         node_id=citation.node.node_id,
                         score=citation.score,
                         query_log_id=log_id,
+                        query_log_timestamp=timestamp,
                     )
             except Exception as e:
                 logger.error(f"Error storing cited documents: {e}")
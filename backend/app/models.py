@@ -26,6 +26,15 @@ class TopQueriedDocument(BaseModel):
     file_path: str
     count: int
 
+class TopQueryTopic(BaseModel):
+    topic_id: int
+    label: Optional[str] = None
+    representative_queries: list[str]
+    count: int
+    share: float
+    success_rate: float
+    avg_latency: float
+
 class QueryLogVolumeMetrics(BaseModel):
     daily_count: int
     weekly_count: int
@@ -36,7 +45,7 @@ class UserQuery(BaseModel):
 
 class Timeframe(BaseModel):
     start_date: Optional[date] = None
-    end_date: Optional[date] = date.today()
+    end_date: Optional[date] = None
 
 class TopKQuery(BaseModel):
     k: Optional[int] = None
@@ -50,6 +59,10 @@ class TopKDocCiteQuery(TopKQuery, Timeframe):
 class QueryLogInput(TopKQuery, Timeframe):
     include_citations: Optional[bool] = False
     include_errors: Optional[bool] = False
+    # Searches rank the most recent QUERY_LOG_SEARCH_CANDIDATES matches, not all of them
+    search: Optional[str] = None
+    fuzzy: Optional[bool] = False
+    offset: Optional[int] = 0
 
 class QueryLogOutput(BaseModel):
     id: int
@@ -58,5 +71,40 @@ class QueryLogOutput(BaseModel):
     latency: float
     success: bool
     error: Optional[str] = None
+    prompt_tokens: Optional[int] = None
     timestamp: datetime
-    citations: Optional[list[Citation]] = None
\ No newline at end of file
+    rank: Optional[float] = None
+    citations: Optional[list[Citation]] = None
+
+class CacheStats(BaseModel):
+    entries: int
+    bytes: int
+    max_bytes: int
+    hits: int
+    misses: int
+    evictions: int
+    hit_ratio: float
+
+class AdmissionStats(BaseModel):
+    max_concurrency: int
+    max_queue: int
+    timeout: float
+    in_flight: int
+    queue_depth: int
+    admitted: int
+    rejected: int
+    timeouts: int
+    failures: int
+    breaker_state: str
+    breaker_consecutive_failures: int
+
+class VectorReplicaStats(BaseModel):
+    enabled: bool
+    loaded: bool
+    version: Optional[int] = None
+    rows: int
+    embedding_bytes: int
+    terms: int
+    refreshes: int
+    queries: int
+    fallbacks: int
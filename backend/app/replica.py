@@ -0,0 +1,368 @@
+from llama_index.core.vector_stores.types import VectorStoreQuery, VectorStoreQueryMode
+from llama_index.vector_stores.postgres.base import DBEmbeddingRow
+from nltk.stem.snowball import SnowballStemmer
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+from typing import Optional
+import logging
+import re
+import threading
+import time
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+VECTOR_STORE_VERSIONS_DDL = """
+CREATE TABLE IF NOT EXISTS vector_store_versions (
+    name TEXT PRIMARY KEY,
+    version BIGINT NOT NULL,
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT now()
+)
+"""
+
+# Stopwords of the `english` text search configuration, which PGVectorStore uses by default (tsearch_data/english.stop)
+STOPWORDS = frozenset(
+    "i me my myself we our ours ourselves you your yours yourself yourselves he him his himself she her hers herself "
+    "it its itself they them their theirs themselves what which who whom this that these those am is are was were be "
+    "been being have has had having do does did doing a an the and but if or because as until while of at by for with "
+    "about against between into through during before after above below to from up down in out on off over under "
+    "again further then once here there when where why how all any both each few more most other some such no nor "
+    "not only own same so than too very s t can will just don should now".split()
+)
+
+# Ways to rank the sparse results: as Postgres' `ts_rank` does, or by BM25
+SPARSE_RANKINGS = ("ts_rank", "bm25")
+
+# Paths, host names and version numbers, hyphenated words and words, approximating the tokens of Postgres' text search parser
+WORD_PATTERN = re.compile(r"(?P<path>(?:/[\w-]+)+|[\w-]+(?:[./][\w-]+)+)|(?P<compound>[^\W\d_][^\W_]*(?:-[^\W_]+)+)|(?P<word>[^\W_]+)")
+
+stemmer = SnowballStemmer("english")
+
+def lexize(word: str) -> Optional[str]:
+    """
+    Normalize a word as the `english` configuration does: paths and words with digits
+    are only lowercased, stopwords are dropped and other words are stemmed with Snowball.
+    """
+    word = word.lower()
+    if any(character.isdigit() or character in "./" for character in word):
+        return word
+    if word in STOPWORDS:
+        return None
+    return stemmer.stem(word)
+
+def parse(content: str) -> list[list[str]]:
+    """
+    Return the lexemes `to_tsvector` gives a text, grouped by word. A hyphenated
+    word gives its own lexeme followed by those of its parts.
+    """
+    groups = []
+    for match in WORD_PATTERN.finditer(content):
+        words = [match.group()] + (match.group().split("-") if match.lastgroup == "compound" else [])
+        group = [lexeme for lexeme in map(lexize, words) if lexeme]
+        if group:
+            groups.append(group)
+    return groups
+
+def query_terms(query_str: str) -> list[list[str]]:
+    """
+    Return the lexemes of PGVectorStore's sparse query, grouped by operand. The query ORs
+    the lexemes of `plainto_tsquery`, and `to_tsquery` parses them again: each lexeme is
+    stemmed a second time, and that of a hyphenated word becomes the phrase of it and its parts.
+    """
+    return [group for word in parse(query_str) for lexeme in word for group in parse(lexeme)]
+
+def ts_rank_weights(max_positions: int = 255) -> np.ndarray:
+    """
+    Contribution to `ts_rank` of a query lexeme found at n positions of a document, for n
+    up to the 255 positions a tsvector keeps, computed in single precision as Postgres
+    does: 0.1 * sum(1 / j^2, j = 1..n) / (pi^2 / 6), with 0.1 the weight of unlabeled lexemes.
+    """
+    weights = np.zeros(max_positions + 1, dtype=np.float64)
+    weight, resj = np.float32(0.1), np.float32(0)
+    for n in range(1, max_positions + 1):
+        resj = resj + weight / np.float32(n * n)
+        # The first position has the largest weight, and is counted once in the sum
+        weights[n] = np.float64(weight + resj - weight) / 1.64493406685
+    return weights
+
+TS_RANK_WEIGHTS = ts_rank_weights()
+
+def bump_version(engine: Engine, name: str) -> int:
+    """
+    Increment the version of a vector store table after writing to it, so that the
+    replicas of the table pick up the change. Returns the new version.
+    """
+    with engine.begin() as connection:
+        connection.execute(text(VECTOR_STORE_VERSIONS_DDL))
+        return connection.execute(text(
+            "INSERT INTO vector_store_versions (name, version) VALUES (:name, 1) "
+            "ON CONFLICT (name) DO UPDATE SET version = vector_store_versions.version + 1, updated_at = now() "
+            "RETURNING version"
+        ), {"name": name}).scalar()
+
+class _ReplicaSnapshot:
+    """
+    Immutable copy of a vector store table: the unit length embeddings as one contiguous
+    matrix, and an inverted index of the lexemes Postgres indexed the texts with, with
+    their number of positions. A refresh builds a new snapshot, so searches never see a
+    partial update.
+    """
+
+    def __init__(
+        self,
+        version: int,
+        ids: np.ndarray,
+        node_ids: list[str],
+        texts: list[str],
+        metadata: list[dict],
+        embeddings: np.ndarray,
+        term_counts: list[dict[str, int]],
+    ):
+        self.version = version
+        self.ids = ids
+        self.node_ids = node_ids
+        self.texts = texts
+        self.metadata = metadata
+        self.embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+        self.term_counts = term_counts
+        self.lengths = np.asarray([sum(counts.values()) for counts in term_counts], dtype=np.float32)
+        self.average_length = float(self.lengths.mean()) if len(self.lengths) else 0.0
+
+        # term -> (document positions, term frequencies), frequencies being counted as in the tsvector
+        postings: dict[str, tuple[list[int], list[int]]] = {}
+        for position, counts in enumerate(term_counts):
+            for term, count in counts.items():
+                documents, frequencies = postings.setdefault(term, ([], []))
+                documents.append(position)
+                frequencies.append(count)
+        self.postings = {
+            term: (np.asarray(documents, dtype=np.int32), np.asarray(frequencies, dtype=np.int32))
+            for term, (documents, frequencies) in postings.items()
+        }
+
+    @classmethod
+    def empty(cls, dim: int) -> "_ReplicaSnapshot":
+        return cls(0, np.empty(0, dtype=np.int64), [], [], [], np.empty((0, dim), dtype=np.float32), [])
+
+# Create VectorReplica class to serve vector store queries from memory
+class VectorReplica:
+    """
+    In-process read replica of a PGVectorStore table, for corpora small enough to fit in memory.
+
+    Dense queries are scored against all embeddings at once with a single matrix product,
+    and sparse queries over an inverted index, so a retrieval costs no database round trip.
+    The index holds the lexemes of the table's `text_search_tsv` column, and queries are
+    stemmed as Postgres stems them, so the matches are the same. With the `ts_rank`
+    ranking they are also scored as Postgres scores them, while `bm25` ranks them by BM25.
+    Postgres remains the source of truth: writers bump the table's version with
+    `bump_version`, and the replica checks the version at most every `refresh_interval`
+    seconds, then loads the rows added since its last refresh and drops the deleted ones.
+    """
+
+    def __init__(
+        self,
+        engine: Engine,
+        table_name: str,
+        embed_dim: int,
+        refresh_interval: float = 5.0,
+        sparse_ranking: str = "ts_rank",
+        k1: float = 1.2,
+        b: float = 0.75,
+    ):
+        if sparse_ranking not in SPARSE_RANKINGS:
+            raise ValueError(f"Unknown sparse ranking '{sparse_ranking}', expected one of {', '.join(SPARSE_RANKINGS)}.")
+        self.engine = engine
+        self.table_name = table_name
+        self.embed_dim = embed_dim
+        self.refresh_interval = refresh_interval
+        self.sparse_ranking = sparse_ranking
+        self.k1 = k1
+        self.b = b
+        self._snapshot: Optional[_ReplicaSnapshot] = None
+        self._lock = threading.Lock()
+        self._checked_at = 0.0
+        self.refreshes = 0
+        self.queries = 0
+        self.fallbacks = 0
+
+    def _load(self, snapshot: _ReplicaSnapshot) -> _ReplicaSnapshot:
+        """
+        Read the table's version, the IDs of all rows and the rows missing from the snapshot,
+        in one consistent view, and return the updated snapshot.
+        """
+        with self.engine.connect().execution_options(isolation_level="REPEATABLE READ") as connection, connection.begin():
+            if self._snapshot is None:
+                connection.execute(text(VECTOR_STORE_VERSIONS_DDL))
+            version = connection.execute(
+                text("SELECT version FROM vector_store_versions WHERE name = :name"), {"name": self.table_name}
+            ).scalar() or 0
+            if version == snapshot.version and self._snapshot is not None:
+                return snapshot
+            current_ids = np.asarray(connection.execute(text(f"SELECT id FROM {self.table_name}")).scalars().all(), dtype=np.int64)
+            # Compare ID sets rather than fetching IDs above the largest seen, since concurrent
+            # ingestions may commit rows in a different order than their IDs
+            new_ids = np.setdiff1d(current_ids, snapshot.ids)
+            # Fetch the embeddings in pgvector's binary format, which is much faster to read than
+            # arrays, and the lexemes of the texts with their number of positions
+            rows = connection.execute(text(
+                f"SELECT id, node_id, text, metadata_, vector_send(embedding), "
+                f"ARRAY(SELECT lexeme FROM unnest(text_search_tsv)), "
+                f"ARRAY(SELECT coalesce(cardinality(positions), 1) FROM unnest(text_search_tsv)) "
+                f"FROM {self.table_name} WHERE id = ANY(CAST(:ids AS bigint[])) ORDER BY id"
+            ), {"ids": new_ids.tolist()}).all() if len(new_ids) else []
+
+        keep = np.flatnonzero(np.isin(snapshot.ids, current_ids))
+        # The binary format is a 2 byte dimension count, 2 unused bytes and big-endian float4 values
+        embeddings = np.empty((len(rows), self.embed_dim), dtype=np.float32)
+        for i, row in enumerate(rows):
+            embeddings[i] = np.frombuffer(row[4], dtype=">f4", offset=4)
+        embeddings /= np.maximum(np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12)
+        logger.info(f"Replica of {self.table_name} at version {version}: {len(rows)} rows added, {len(snapshot.ids) - len(keep)} removed.")
+        return _ReplicaSnapshot(
+            version,
+            np.concatenate([snapshot.ids[keep], np.asarray([row[0] for row in rows], dtype=np.int64)]),
+            [snapshot.node_ids[i] for i in keep] + [row[1] for row in rows],
+            [snapshot.texts[i] for i in keep] + [row[2] for row in rows],
+            [snapshot.metadata[i] for i in keep] + [row[3] for row in rows],
+            np.concatenate([snapshot.embeddings[keep], embeddings]),
+            [snapshot.term_counts[i] for i in keep] + [dict(zip(row[5], row[6])) for row in rows],
+        )
+
+    def refresh(self, force: bool = False) -> bool:
+        """
+        Bring the replica up to date with the table, if its version changed. Unless forced,
+        the version is checked at most every `refresh_interval` seconds, and a refresh
+        already running in another thread is not waited for. Returns whether the replica is loaded.
+        """
+        if not force and time.monotonic() - self._checked_at < self.refresh_interval:
+            return self._snapshot is not None
+        if not self._lock.acquire(blocking=force or self._snapshot is None):
+            return True
+        try:
+            self._checked_at = time.monotonic()
+            snapshot = self._load(self._snapshot or _ReplicaSnapshot.empty(self.embed_dim))
+            if snapshot is not self._snapshot:
+                self._snapshot = snapshot
+                self.refreshes += 1
+        except Exception as e:
+            # Keep serving the previous snapshot, if any, until the database is reachable again
+            logger.warning(f"Error refreshing the replica of {self.table_name}: {e}")
+        finally:
+            self._lock.release()
+        return self._snapshot is not None
+
+    def dense_search(self, snapshot: _ReplicaSnapshot, embedding: list[float], k: Optional[int]) -> list[DBEmbeddingRow]:
+        """Return the `k` rows of highest cosine similarity to an embedding."""
+        query = np.asarray(embedding, dtype=np.float32)
+        similarities = snapshot.embeddings @ (query / max(np.linalg.norm(query), 1e-12))
+        return self._top_rows(snapshot, similarities, k)
+
+    def sparse_search(self, snapshot: _ReplicaSnapshot, query_str: str, k: Optional[int]) -> list[DBEmbeddingRow]:
+        """
+        Return the `k` rows matching the query with the highest scores. A row matches when
+        it has any of the query's lexemes, or all the lexemes of a hyphenated word.
+
+        With the `ts_rank` ranking the scores are those of Postgres. With `bm25` they are
+        divided by the score of a document saturated with every query term, which puts
+        them between 0 and 1 like the similarities of dense results.
+        """
+        groups = query_terms(query_str)
+        # Postgres adds up the lexemes in byte order, which matters for single precision sums
+        terms = sorted({term for group in groups for term in group}, key=str.encode)
+        if not terms:
+            return []
+        matched = np.zeros(len(snapshot.ids), dtype=bool)
+        for group in map(set, groups):
+            if not group <= snapshot.postings.keys():
+                continue
+            if len(group) == 1:
+                matched[snapshot.postings[next(iter(group))][0]] = True
+            else:
+                # Positions are not kept, so a phrase matches wherever all of its lexemes appear
+                counts = np.zeros(len(snapshot.ids), dtype=np.int32)
+                for term in group:
+                    counts[snapshot.postings[term][0]] += 1
+                matched |= counts == len(group)
+
+        scores = np.zeros(len(snapshot.ids), dtype=np.float32)
+        norms = self.k1 * (1 - self.b + self.b * snapshot.lengths / max(snapshot.average_length, 1e-12))
+        max_score = 0.0
+        for term in terms:
+            if term not in snapshot.postings:
+                continue
+            documents, frequencies = snapshot.postings[term]
+            # A term appears once per posting list, so the scores can be added without np.add.at
+            if self.sparse_ranking == "ts_rank":
+                scores[documents] = scores[documents] + TS_RANK_WEIGHTS[np.minimum(frequencies, len(TS_RANK_WEIGHTS) - 1)]
+            else:
+                idf = np.log(1 + (len(snapshot.ids) - len(documents) + 0.5) / (len(documents) + 0.5))
+                scores[documents] += idf * frequencies * (self.k1 + 1) / (frequencies + norms[documents])
+                max_score += idf * (self.k1 + 1)
+        # ts_rank averages over the query's lexemes, found or not
+        scores /= np.float32(len(terms)) if self.sparse_ranking == "ts_rank" else np.float32(max(max_score, 1e-12))
+        matches = np.flatnonzero(matched)
+        return self._top_rows(snapshot, scores[matches], k, matches)
+
+    @staticmethod
+    def _top_rows(snapshot: _ReplicaSnapshot, scores: np.ndarray, k: Optional[int], positions: Optional[np.ndarray] = None) -> list[DBEmbeddingRow]:
+        """
+        Return the rows of the `k` highest scores, highest first and ties in row order. Without
+        `k` all rows are returned, as PGVectorStore does for a `similarity_top_k` of None.
+        """
+        if k is not None and k <= 0:
+            top = np.arange(0)
+        elif k is not None and k < len(scores):
+            # Keep the scores above the k-th highest, then the first rows tied with it
+            kth = -np.partition(-scores, k - 1)[k - 1]
+            above = np.flatnonzero(scores > kth)
+            top = np.concatenate([above, np.flatnonzero(scores == kth)[:k - len(above)]])
+        else:
+            top = np.arange(len(scores))
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return [
+            DBEmbeddingRow(
+                node_id=snapshot.node_ids[i],
+                text=snapshot.texts[i],
+                metadata=snapshot.metadata[i],
+                similarity=float(score),
+            )
+            for i, score in zip(positions[top] if positions is not None else top, scores[top])
+        ]
+
+    def query(self, query: VectorStoreQuery) -> Optional[list[DBEmbeddingRow]]:
+        """
+        Answer a vector store query as PGVectorStore does, hybrid results being the dense
+        results followed by the new sparse ones. Returns None for queries the replica cannot
+        answer, such as filtered queries, or while it is not loaded.
+        """
+        if query.filters is not None or query.node_ids or query.doc_ids or not self.refresh():
+            self.fallbacks += 1
+            return None
+        snapshot = self._snapshot
+        sparse_top_k = query.sparse_top_k or query.similarity_top_k
+        if query.mode == VectorStoreQueryMode.DEFAULT and query.query_embedding is not None:
+            results = self.dense_search(snapshot, query.query_embedding, query.similarity_top_k)
+        elif query.mode in (VectorStoreQueryMode.SPARSE, VectorStoreQueryMode.TEXT_SEARCH) and query.query_str is not None:
+            results = self.sparse_search(snapshot, query.query_str, sparse_top_k)
+        elif query.mode == VectorStoreQueryMode.HYBRID and query.query_embedding is not None and query.query_str is not None:
+            results = self.dense_search(snapshot, query.query_embedding, query.similarity_top_k)
+            seen = {row.node_id for row in results}
+            results += [row for row in self.sparse_search(snapshot, query.query_str, sparse_top_k) if row.node_id not in seen]
+        else:
+            self.fallbacks += 1
+            return None
+        self.queries += 1
+        return results
+
+    def stats(self) -> dict:
+        snapshot = self._snapshot
+        return {
+            "loaded": snapshot is not None,
+            "version": snapshot.version if snapshot else None,
+            "rows": len(snapshot.ids) if snapshot else 0,
+            "embedding_bytes": snapshot.embeddings.nbytes if snapshot else 0,
+            "terms": len(snapshot.postings) if snapshot else 0,
+            "refreshes": self.refreshes,
+            "queries": self.queries,
+            "fallbacks": self.fallbacks,
+        }
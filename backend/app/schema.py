@@ -0,0 +1,412 @@
+from sqlalchemy import text
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.exc import DBAPIError
+from datetime import date
+from typing import Optional
+import os
+import re
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Tables partitioned by month on their `timestamp` column, referencing tables first
+PARTITIONED_TABLES = ["cited_documents", "query_logs"]
+
+# Full-text search document of a query log; the query weighs most, then the error, then the response
+QUERY_LOG_SEARCH_VECTOR = (
+    "setweight(to_tsvector('english', coalesce(query, '')), 'A') || "
+    "setweight(to_tsvector('english', coalesce(error, '')), 'B') || "
+    "setweight(to_tsvector('english', coalesce(response, '')), 'C')"
+)
+
+# The search vector is kept up to date by a trigger rather than generated, since adding a generated
+# column rewrites every partition; existing logs are backfilled by `migrate_query_logs.py`
+QUERY_LOG_SEARCH_VECTOR_DDL = [
+    f"""
+    CREATE OR REPLACE FUNCTION query_log_search_vector(query VARCHAR, error VARCHAR, response VARCHAR)
+    RETURNS tsvector LANGUAGE sql IMMUTABLE AS $$ SELECT {QUERY_LOG_SEARCH_VECTOR} $$
+    """,
+    """
+    CREATE OR REPLACE FUNCTION query_logs_search_vector_trigger() RETURNS trigger LANGUAGE plpgsql AS $$
+    BEGIN
+        NEW.search_vector := query_log_search_vector(NEW.query, NEW.error, NEW.response);
+        RETURN NEW;
+    END
+    $$
+    """,
+]
+
+QUERY_LOG_SEARCH_TRIGGER = (
+    "CREATE TRIGGER query_logs_search_vector BEFORE INSERT OR UPDATE OF query, error, response ON query_logs "
+    "FOR EACH ROW EXECUTE FUNCTION query_logs_search_vector_trigger()"
+)
+
+# Text of a query log matched by fuzzy (trigram) search
+QUERY_LOG_SEARCH_TEXT = "coalesce(query, '') || ' ' || coalesce(error, '') || ' ' || coalesce(response, '')"
+
+# Dimension of the query embeddings stored with query logs, the vector store's `embed_dim`
+QUERY_EMBEDDING_DIM = 768
+
+# Columns added to existing tables after they were first created
+COLUMN_UPGRADES = [
+    "ALTER TABLE IF EXISTS query_logs ADD COLUMN IF NOT EXISTS prompt_tokens INTEGER",
+    "ALTER TABLE IF EXISTS query_logs ADD COLUMN IF NOT EXISTS search_vector tsvector",
+    f"ALTER TABLE IF EXISTS query_logs ADD COLUMN IF NOT EXISTS embedding vector({QUERY_EMBEDDING_DIM})",
+    "ALTER TABLE IF EXISTS query_logs ADD COLUMN IF NOT EXISTS topic_id INTEGER",
+]
+
+# Statistics target of the search vector, above the default of 100, so the planner knows the
+# frequencies of more lexemes and does not overestimate the matches of rare ones
+QUERY_LOG_SEARCH_STATISTICS = 1000
+
+# Indexes of the query logs, by name. They are created on the partitioned table only, which new
+# partitions inherit, and built on existing partitions by `migrate_query_logs.py` without blocking writes
+QUERY_LOG_INDEXES = {
+    "query_logs_search_idx": "GIN (search_vector)",
+    # Query logs not yet assigned to a topic by `topics.update_topics`
+    "query_logs_unassigned_topic_idx": "btree (timestamp) WHERE embedding IS NOT NULL AND topic_id IS NULL",
+}
+
+# Indexes of the query logs that need the pg_trgm extension, skipped if it cannot be installed
+QUERY_LOG_TRIGRAM_INDEXES = {
+    "query_logs_search_trgm_idx": f"GIN (({QUERY_LOG_SEARCH_TEXT}) gin_trgm_ops)",
+}
+
+# Indexes added to the partitioned tables after they were first created
+INDEX_UPGRADES = [
+    *(f"CREATE INDEX IF NOT EXISTS {name} ON ONLY query_logs USING {definition}" for name, definition in QUERY_LOG_INDEXES.items()),
+]
+
+# Centroids and labels of the query topics, updated incrementally by `topics.update_topics`
+QUERY_TOPICS_DDL = f"""
+CREATE TABLE IF NOT EXISTS query_topics (
+    id INTEGER PRIMARY KEY,
+    centroid vector({QUERY_EMBEDDING_DIM}) NOT NULL,
+    size INTEGER NOT NULL DEFAULT 0,
+    label VARCHAR,
+    representative_queries JSONB NOT NULL DEFAULT '[]',
+    updated_at TIMESTAMP
+)
+"""
+
+TRIGRAM_INDEX_UPGRADES = [
+    f"CREATE INDEX IF NOT EXISTS {name} ON ONLY query_logs USING {definition}" for name, definition in QUERY_LOG_TRIGRAM_INDEXES.items()
+]
+
+PARTITIONED_TABLES_DDL = [
+    "CREATE SEQUENCE IF NOT EXISTS query_logs_id_seq",
+    f"""
+    CREATE TABLE query_logs (
+        id INTEGER NOT NULL DEFAULT nextval('query_logs_id_seq'),
+        query VARCHAR,
+        response VARCHAR,
+        latency FLOAT,
+        success BOOLEAN,
+        error VARCHAR,
+        prompt_tokens INTEGER,
+        timestamp TIMESTAMP NOT NULL,
+        search_vector tsvector,
+        embedding vector({QUERY_EMBEDDING_DIM}),
+        topic_id INTEGER,
+        PRIMARY KEY (id, timestamp)
+    ) PARTITION BY RANGE (timestamp)
+    """,
+    "ALTER SEQUENCE query_logs_id_seq OWNED BY query_logs.id",
+    "CREATE INDEX IF NOT EXISTS query_logs_timestamp_idx ON query_logs (timestamp)",
+    "CREATE INDEX IF NOT EXISTS query_logs_success_idx ON query_logs (success)",
+    "CREATE SEQUENCE IF NOT EXISTS cited_documents_id_seq",
+    """
+    CREATE TABLE cited_documents (
+        id INTEGER NOT NULL DEFAULT nextval('cited_documents_id_seq'),
+        file_path VARCHAR,
+        node_id VARCHAR,
+        score FLOAT,
+        query_log_id INTEGER,
+        timestamp TIMESTAMP NOT NULL,
+        PRIMARY KEY (id, timestamp)
+    ) PARTITION BY RANGE (timestamp)
+    """,
+    "ALTER SEQUENCE cited_documents_id_seq OWNED BY cited_documents.id",
+    "CREATE INDEX IF NOT EXISTS cited_documents_query_log_idx ON cited_documents (query_log_id, timestamp)",
+]
+
+def month_start(day: date) -> date:
+    return date(day.year, day.month, 1)
+
+def add_months(month: date, months: int) -> date:
+    index = month.year * 12 + month.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+def partition_name(table: str, month: date) -> str:
+    return f"{table}_{month:%Y_%m}"
+
+def _relkind(connection: Connection, table: str) -> Optional[str]:
+    """Return `p` for a partitioned table, `r` for a regular one, or None if it does not exist."""
+    return connection.execute(
+        text("SELECT relkind FROM pg_class WHERE oid = to_regclass(:table)"),
+        {"table": table},
+    ).scalar()
+
+def ensure_partitions(connection: Connection, start_month: date, end_month: date):
+    """
+    Create the monthly partitions of every partitioned table from `start_month` to `end_month`, inclusive.
+    """
+    month = month_start(start_month)
+    while month <= end_month:
+        for table in PARTITIONED_TABLES:
+            connection.execute(text(
+                f"CREATE TABLE IF NOT EXISTS {partition_name(table, month)} PARTITION OF {table} "
+                f"FOR VALUES FROM ('{month}') TO ('{add_months(month, 1)}')"
+            ))
+        # New partitions do not inherit the statistics targets of the partitioned table
+        _set_search_statistics(connection, partition_name("query_logs", month))
+        month = add_months(month, 1)
+
+def _set_search_statistics(connection: Connection, table: str):
+    """
+    Set the statistics target of the search vector of a query log table, and of its partitions,
+    unless already set. Takes effect at the next ANALYZE of the table.
+    """
+    target = connection.execute(
+        text("SELECT attstattarget FROM pg_attribute WHERE attrelid = to_regclass(:table) AND attname = 'search_vector'"),
+        {"table": table},
+    ).scalar()
+    if target != QUERY_LOG_SEARCH_STATISTICS:
+        connection.execute(text(f"ALTER TABLE {table} ALTER COLUMN search_vector SET STATISTICS {QUERY_LOG_SEARCH_STATISTICS}"))
+
+def _ensure_search_vector_trigger(connection: Connection):
+    """
+    Create the functions computing the search vector of new and updated query logs, and
+    their trigger on the partitioned table, which new partitions inherit.
+    """
+    for statement in QUERY_LOG_SEARCH_VECTOR_DDL:
+        connection.execute(text(statement))
+    exists = connection.execute(text(
+        "SELECT 1 FROM pg_trigger WHERE tgrelid = to_regclass('query_logs') AND tgname = 'query_logs_search_vector'"
+    )).scalar()
+    if not exists:
+        connection.execute(text(QUERY_LOG_SEARCH_TRIGGER))
+
+def _partition_unpartitioned_tables(connection: Connection):
+    """
+    Move the rows of the original, unpartitioned tables into partitioned ones.
+    Cited documents get their query log's timestamp as partition key, and
+    cited documents without a query log are dropped.
+    """
+    for table in PARTITIONED_TABLES:
+        if _relkind(connection, table) == "r":
+            logger.info(f"Migrating {table} to monthly partitions.")
+            connection.execute(text(f"ALTER TABLE {table} RENAME TO {table}_unpartitioned"))
+            connection.execute(text(f"ALTER TABLE {table}_unpartitioned RENAME CONSTRAINT {table}_pkey TO {table}_unpartitioned_pkey"))
+    connection.execute(text("ALTER TABLE IF EXISTS cited_documents_unpartitioned DROP CONSTRAINT IF EXISTS cited_documents_query_log_id_fkey"))
+    connection.execute(text("DROP INDEX IF EXISTS query_logs_timestamp_idx, query_logs_success_idx"))
+
+    for statement in PARTITIONED_TABLES_DDL:
+        connection.execute(text(statement))
+
+    if _relkind(connection, "query_logs_unpartitioned") is None:
+        return
+    first, last = connection.execute(text("SELECT min(timestamp), max(timestamp) FROM query_logs_unpartitioned")).one()
+    if first is not None:
+        ensure_partitions(connection, month_start(first.date()), month_start(last.date()))
+    connection.execute(text(
+        "INSERT INTO query_logs (id, query, response, latency, success, error, prompt_tokens, timestamp) "
+        "SELECT id, query, response, latency, success, error, prompt_tokens, timestamp FROM query_logs_unpartitioned"
+    ))
+    if _relkind(connection, "cited_documents_unpartitioned") is not None:
+        connection.execute(text(
+            "INSERT INTO cited_documents (id, file_path, node_id, score, query_log_id, timestamp) "
+            "SELECT c.id, c.file_path, c.node_id, c.score, c.query_log_id, q.timestamp "
+            "FROM cited_documents_unpartitioned c JOIN query_logs_unpartitioned q ON c.query_log_id = q.id"
+        ))
+        connection.execute(text("SELECT setval('cited_documents_id_seq', (SELECT coalesce(max(id), 0) + 1 FROM cited_documents), false)"))
+        connection.execute(text("DROP TABLE cited_documents_unpartitioned"))
+    connection.execute(text("SELECT setval('query_logs_id_seq', (SELECT coalesce(max(id), 0) + 1 FROM query_logs), false)"))
+    connection.execute(text("DROP TABLE query_logs_unpartitioned"))
+
+def _install_extension(connection: Connection, name: str) -> bool:
+    """
+    Install a Postgres extension if possible, and return whether it is installed.
+    """
+    try:
+        with connection.begin_nested():
+            connection.execute(text(f"CREATE EXTENSION IF NOT EXISTS {name}"))
+    except DBAPIError as e:
+        logger.warning(f"Could not install the {name} extension: {str(e.orig).splitlines()[0]}")
+    return connection.execute(
+        text("SELECT 1 FROM pg_extension WHERE extname = :name"),
+        {"name": name},
+    ).scalar() is not None
+
+def upgrade_schema(engine: Engine):
+    """
+    Create the query log tables as monthly partitioned tables, or migrate existing
+    unpartitioned ones, and bring their columns up to date with the ORM models.
+    Only takes brief locks on existing tables: the search vectors and indexes of
+    existing query logs are built by `migrate_query_logs.py`.
+    """
+    with engine.begin() as connection:
+        # Serialize schema upgrades between workers starting at the same time
+        connection.execute(text("SELECT pg_advisory_xact_lock(hashtext('upgrade_schema'))"))
+        connection.execute(text("CREATE EXTENSION IF NOT EXISTS vector"))
+        for statement in COLUMN_UPGRADES:
+            connection.execute(text(statement))
+        if _relkind(connection, "query_logs") != "p":
+            _partition_unpartitioned_tables(connection)
+        _ensure_search_vector_trigger(connection)
+        for statement in INDEX_UPGRADES:
+            connection.execute(text(statement))
+        _set_search_statistics(connection, "query_logs")
+        connection.execute(text(QUERY_TOPICS_DDL))
+        if _install_extension(connection, "pg_trgm"):
+            for statement in TRIGRAM_INDEX_UPGRADES:
+                connection.execute(text(statement))
+        this_month = month_start(date.today())
+        ensure_partitions(connection, this_month, add_months(this_month, int(os.getenv("PARTITION_MONTHS_AHEAD", 2))))
+
+def _partition_month(table: str, name: str) -> Optional[date]:
+    match = re.fullmatch(rf"{table}_(\d{{4}})_(\d{{2}})", name)
+    return date(int(match.group(1)), int(match.group(2)), 1) if match else None
+
+def list_partition_months(connection: Connection, table: str) -> list[date]:
+    """
+    List the months of the attached partitions of a partitioned table.
+    """
+    names = connection.execute(text(
+        "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+        "WHERE i.inhparent = to_regclass(:table)"
+    ), {"table": table}).scalars()
+    return sorted(month for month in (_partition_month(table, name) for name in names) if month)
+
+def list_detached_partition_months(connection: Connection, table: str) -> list[date]:
+    """
+    List the months of tables named as partitions of a partitioned table but not attached
+    to it, such as partitions left detached by an interrupted retention run.
+    """
+    names = connection.execute(text(
+        "SELECT c.relname FROM pg_class c JOIN pg_namespace n ON n.oid = c.relnamespace "
+        "WHERE c.relkind = 'r' AND NOT c.relispartition AND n.nspname = current_schema() AND c.relname ~ :pattern"
+    ), {"pattern": rf"^{table}_\d{{4}}_\d{{2}}$"}).scalars()
+    return sorted(month for month in (_partition_month(table, name) for name in names) if month)
+
+def _check_archive_prerequisites(archive_dir: str, archive_format: str):
+    """
+    Fail before touching any partition if archives cannot be written.
+    """
+    if archive_format not in ("csv", "parquet"):
+        raise ValueError(f"Unknown archive format: {archive_format}")
+    if archive_format == "parquet":
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            raise RuntimeError("Archiving partitions as parquet requires `pyarrow` to be installed.")
+    os.makedirs(archive_dir, exist_ok=True)
+    if not os.access(archive_dir, os.W_OK):
+        raise PermissionError(f"Cannot write archives to {archive_dir}.")
+
+def _archive_partition(connection: Connection, name: str, archive_dir: str, archive_format: str) -> str:
+    """
+    Write a partition to a compressed file in `archive_dir`, and return its path.
+    """
+    import pandas as pd
+
+    # The search vector is derived from the other columns and not archived
+    columns = connection.execute(text(
+        "SELECT column_name FROM information_schema.columns "
+        "WHERE table_name = :name AND is_generated = 'NEVER' AND column_name <> 'search_vector' ORDER BY ordinal_position"
+    ), {"name": name}).scalars().all()
+    chunks = pd.read_sql(text(f"SELECT {', '.join(columns)} FROM {name}"), connection, chunksize=50000)
+    if archive_format == "parquet":
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        path = os.path.join(archive_dir, f"{name}.parquet")
+        writer = None
+        for chunk in chunks:
+            table = pa.Table.from_pandas(chunk, preserve_index=False)
+            if writer is None:
+                # Columns that are all NULL in the first chunk hold text in this schema
+                schema = pa.schema([
+                    field.with_type(pa.string()) if pa.types.is_null(field.type) else field
+                    for field in table.schema
+                ])
+                writer = pq.ParquetWriter(path, schema, compression="zstd")
+            writer.write_table(table.cast(schema))
+        if writer is not None:
+            writer.close()
+    else:
+        path = os.path.join(archive_dir, f"{name}.csv.gz")
+        header = True
+        for chunk in chunks:
+            chunk.to_csv(path, mode="w" if header else "a", header=header, index=False, compression="gzip")
+            header = False
+    return path
+
+def apply_retention(
+    engine: Engine,
+    retention_months: int,
+    action: str = "archive",
+    archive_dir: str = "./archive",
+    archive_format: str = "csv",
+) -> list[str]:
+    """
+    Archive the partitions older than `retention_months` full months to compressed files
+    before dropping them, or just drop them, depending on `action`. Returns the names of
+    the removed partitions.
+
+    Each partition is archived and dropped in a single transaction, so a failed archive
+    leaves it attached, to be retried by the next run. Tables named as partitions but no
+    longer attached, left by earlier versions of this function, are archived and dropped too.
+    Only one run proceeds at a time; concurrent runs return right away.
+    """
+    if action not in ("archive", "drop"):
+        raise ValueError(f"Unknown retention action: {action}")
+    if action == "archive":
+        _check_archive_prerequisites(archive_dir, archive_format)
+
+    cutoff = add_months(month_start(date.today()), -retention_months)
+    with engine.connect() as lock_connection:
+        # Skip the run if another worker or the cron script is applying retention
+        if not lock_connection.execute(text("SELECT pg_try_advisory_lock(hashtext('apply_retention'))")).scalar():
+            logger.info("Another retention run is in progress.")
+            return []
+        try:
+            expired = []
+            with engine.connect() as connection:
+                for table in PARTITIONED_TABLES:
+                    expired += [(month, partition_name(table, month)) for month in list_partition_months(connection, table) if month < cutoff]
+                    for month in list_detached_partition_months(connection, table):
+                        if month < cutoff:
+                            expired.append((month, partition_name(table, month)))
+                        else:
+                            logger.warning(f"Table {partition_name(table, month)} is not attached to {table}; attach or drop it.")
+
+            removed = []
+            for _, name in sorted(expired):
+                with engine.begin() as connection:
+                    # Block writes to the partition while it is archived, so no row is lost
+                    connection.execute(text(f"LOCK TABLE {name} IN SHARE MODE"))
+                    if action == "archive":
+                        path = _archive_partition(connection, name, archive_dir, archive_format)
+                        logger.info(f"Archived partition {name} to {path}.")
+                    # Dropping an attached partition detaches it in the same transaction
+                    connection.execute(text(f"DROP TABLE {name}"))
+                removed.append(name)
+            return removed
+        finally:
+            lock_connection.execute(text("SELECT pg_advisory_unlock(hashtext('apply_retention'))"))
+
+def apply_retention_from_env(engine: Engine) -> list[str]:
+    """
+    Apply the retention policy configured in the environment, if any.
+    """
+    retention_months = os.getenv("QUERY_LOG_RETENTION_MONTHS")
+    if not retention_months:
+        return []
+    return apply_retention(
+        engine,
+        retention_months=int(retention_months),
+        action=os.getenv("QUERY_LOG_RETENTION_ACTION", "archive"),
+        archive_dir=os.getenv("QUERY_LOG_ARCHIVE_DIR", "./archive"),
+        archive_format=os.getenv("QUERY_LOG_ARCHIVE_FORMAT", "csv"),
+    )
@@ -0,0 +1,186 @@
+from sqlalchemy import text
+from sqlalchemy.engine import Connection, Engine
+from datetime import datetime, timezone
+from typing import Optional
+import json
+import logging
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    """Scale vectors to unit length, so dot products are cosine similarities."""
+    return vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+
+def _kmeans_plus_plus(embeddings: np.ndarray, n_topics: int, rng: np.random.Generator) -> np.ndarray:
+    """
+    Pick initial centroids among the embeddings, each with a probability proportional
+    to its squared cosine distance from the centroids picked so far (k-means++).
+    """
+    centroids = [embeddings[rng.integers(len(embeddings))]]
+    distances = 1 - embeddings @ centroids[0]
+    for _ in range(1, n_topics):
+        weights = np.maximum(distances, 0) ** 2
+        if weights.sum() > 0:
+            index = rng.choice(len(embeddings), p=weights / weights.sum())
+        else:
+            index = rng.integers(len(embeddings))
+        centroids.append(embeddings[index])
+        distances = np.minimum(distances, 1 - embeddings @ embeddings[index])
+    return np.stack(centroids)
+
+def _minibatch_update(centroids: np.ndarray, counts: np.ndarray, embeddings: np.ndarray, labels: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Move each centroid towards the mean of its new members, with a learning rate of its
+    new members over all its members so far (mini-batch k-means), and keep it on the unit sphere.
+    """
+    batch_counts = np.bincount(labels, minlength=len(centroids))
+    sums = np.zeros_like(centroids)
+    np.add.at(sums, labels, embeddings)
+    counts = counts + batch_counts
+    updated = batch_counts > 0
+    rate = (batch_counts[updated] / counts[updated])[:, None]
+    centroids = centroids.copy()
+    centroids[updated] = (1 - rate) * centroids[updated] + rate * sums[updated] / batch_counts[updated, None]
+    return _normalize(centroids), counts
+
+def _update_representatives(
+    representatives: list[list[dict]],
+    centroids: np.ndarray,
+    embeddings: np.ndarray,
+    labels: np.ndarray,
+    queries: list[str],
+    n_representatives: int,
+) -> list[list[dict]]:
+    """
+    Keep, for each topic, the distinct queries closest to its centroid among its
+    previous representatives and its new members.
+    """
+    similarities = np.einsum("ij,ij->i", embeddings, centroids[labels])
+    for topic in np.unique(labels):
+        members = np.flatnonzero(labels == topic)
+        candidates = representatives[topic] + [
+            {"query": queries[i], "similarity": float(similarities[i])} for i in members
+        ]
+        distinct = {}
+        for candidate in sorted(candidates, key=lambda candidate: -candidate["similarity"]):
+            distinct.setdefault(" ".join(candidate["query"].lower().split()), candidate)
+        representatives[topic] = list(distinct.values())[:n_representatives]
+    return representatives
+
+def _vector_literal(vector: np.ndarray) -> str:
+    return "[" + ",".join(f"{value:.7g}" for value in vector) + "]"
+
+def _load_topics(connection: Connection) -> tuple[Optional[np.ndarray], Optional[np.ndarray], list[list[dict]]]:
+    """
+    Load the centroids, member counts and representative queries of the topics, if any.
+    """
+    rows = connection.execute(text(
+        "SELECT id, centroid::real[], size, representative_queries FROM query_topics ORDER BY id"
+    )).all()
+    if not rows:
+        return None, None, []
+    centroids = _normalize(np.asarray([row[1] for row in rows], dtype=np.float32))
+    counts = np.asarray([row[2] for row in rows], dtype=np.int64)
+    return centroids, counts, [list(row[3]) for row in rows]
+
+def _save_topics(connection: Connection, centroids: np.ndarray, counts: np.ndarray, representatives: list[list[dict]]):
+    """
+    Store the centroids, member counts and representative queries of the topics.
+    The most representative query labels each topic.
+    """
+    updated_at = datetime.now(timezone.utc)
+    connection.execute(text(
+        "INSERT INTO query_topics (id, centroid, size, label, representative_queries, updated_at) "
+        "VALUES (:id, CAST(:centroid AS vector), :size, :label, CAST(:representative_queries AS jsonb), :updated_at) "
+        "ON CONFLICT (id) DO UPDATE SET centroid = EXCLUDED.centroid, size = EXCLUDED.size, label = EXCLUDED.label, "
+        "representative_queries = EXCLUDED.representative_queries, updated_at = EXCLUDED.updated_at"
+    ), [
+        {
+            "id": topic,
+            "centroid": _vector_literal(centroids[topic]),
+            "size": int(counts[topic]),
+            "label": representatives[topic][0]["query"] if representatives[topic] else None,
+            "representative_queries": json.dumps(representatives[topic]),
+            "updated_at": updated_at,
+        }
+        for topic in range(len(centroids))
+    ])
+
+def update_topics(
+    engine: Engine,
+    n_topics: int = 20,
+    batch_size: int = 1000,
+    since: Optional[datetime] = None,
+    n_representatives: int = 5,
+    rebuild: bool = False,
+    seed: int = 0,
+) -> int:
+    """
+    Cluster the query embeddings into topics with mini-batch spherical k-means.
+
+    Only query logs with an embedding and no topic yet are processed, oldest first and
+    `batch_size` at a time: each batch is assigned to the nearest topics, which then move
+    towards their new members. Topic assignments and centroids are stored in the same
+    transaction, so an interrupted run resumes where it stopped. The first run seeds
+    `n_topics` topics from its first batch; `rebuild` clears the topics and starts over.
+    Returns the number of query logs assigned.
+    """
+    rng = np.random.default_rng(seed)
+    with engine.connect() as lock_connection:
+        # Skip the run if another one is still in progress
+        if not lock_connection.execute(text("SELECT pg_try_advisory_lock(hashtext('update_topics'))")).scalar():
+            logger.info("Another topic update is in progress.")
+            return 0
+        try:
+            if rebuild:
+                with engine.begin() as connection:
+                    connection.execute(text("UPDATE query_logs SET topic_id = NULL WHERE topic_id IS NOT NULL"))
+                    connection.execute(text("DELETE FROM query_topics"))
+
+            with engine.connect() as connection:
+                centroids, counts, representatives = _load_topics(connection)
+            if centroids is not None and len(centroids) != n_topics:
+                logger.info(f"Keeping the existing {len(centroids)} topics, rebuild to change their number.")
+
+            assigned = 0
+            while True:
+                with engine.begin() as connection:
+                    rows = connection.execute(text(
+                        "SELECT id, timestamp, query, embedding::real[] FROM query_logs "
+                        "WHERE embedding IS NOT NULL AND topic_id IS NULL AND timestamp >= :since "
+                        "ORDER BY timestamp LIMIT :batch_size"
+                    ), {"since": since or datetime.min, "batch_size": batch_size}).all()
+                    if not rows:
+                        break
+                    embeddings = _normalize(np.asarray([row[3] for row in rows], dtype=np.float32))
+
+                    if centroids is None:
+                        if len(rows) < n_topics:
+                            logger.info(f"Waiting for at least {n_topics} embedded queries to seed the topics.")
+                            break
+                        centroids = _kmeans_plus_plus(embeddings, n_topics, rng)
+                        counts = np.zeros(n_topics, dtype=np.int64)
+                        representatives = [[] for _ in range(n_topics)]
+
+                    labels = np.argmax(embeddings @ centroids.T, axis=1)
+                    centroids, counts = _minibatch_update(centroids, counts, embeddings, labels)
+                    representatives = _update_representatives(
+                        representatives, centroids, embeddings, labels, [row[2] or "" for row in rows], n_representatives
+                    )
+
+                    connection.execute(text(
+                        "UPDATE query_logs SET topic_id = assigned.topic_id "
+                        "FROM unnest(CAST(:ids AS integer[]), CAST(:timestamps AS timestamp[]), CAST(:topic_ids AS integer[])) "
+                        "AS assigned (id, timestamp, topic_id) "
+                        "WHERE query_logs.id = assigned.id AND query_logs.timestamp = assigned.timestamp"
+                    ), {
+                        "ids": [row[0] for row in rows],
+                        "timestamps": [row[1] for row in rows],
+                        "topic_ids": labels.tolist(),
+                    })
+                    _save_topics(connection, centroids, counts, representatives)
+                assigned += len(rows)
+            return assigned
+        finally:
+            lock_connection.execute(text("SELECT pg_advisory_unlock(hashtext('update_topics'))"))
@@ -0,0 +1,188 @@
+from llama_index.vector_stores.postgres import PGVectorStore
+from llama_index.core.bridge.pydantic import PrivateAttr
+from llama_index.core.vector_stores.types import MetadataFilters, VectorStoreQuery, VectorStoreQueryResult
+from pgvector.sqlalchemy import Vector, HALFVEC, BIT
+from sqlalchemy import bindparam, cast, func, select, text
+from typing import Any, List, Optional
+
+# Encodings the HNSW index over the document embeddings can hold
+VECTOR_STORAGE_MODES = ("float32", "halfvec", "binary")
+
+# HNSW parameters of the document embedding index
+HNSW_KWARGS = {
+    "hnsw_m": 16,
+    "hnsw_ef_construction": 64,
+    "hnsw_ef_search": 40,
+    "hnsw_dist_method": "vector_cosine_ops",
+}
+
+# Largest hnsw.ef_search pgvector accepts
+HNSW_MAX_EF_SEARCH = 1000
+
+def default_rerank_factor(storage_mode: str) -> int:
+    """Binary codes rank candidates much more coarsely than half precision vectors, so rerank more of them."""
+    return 10 if storage_mode == "binary" else 4
+
+def supports_storage_mode(pgvector_version: str, storage_mode: str) -> bool:
+    """The halfvec type and binary_quantize() need pgvector 0.7.0 or later."""
+    major, minor = (int(part) for part in pgvector_version.split(".")[:2])
+    return storage_mode == "float32" or (major, minor) >= (0, 7)
+
+def embedding_index_name(table_name: str, storage_mode: str) -> str:
+    # The float32 index keeps the name PGVectorStore gives it
+    if storage_mode == "float32":
+        return f"{table_name}_embedding_idx"
+    return f"{table_name}_embedding_{storage_mode}_idx"
+
+def embedding_index_statement(
+    schema_name: str,
+    table_name: str,
+    storage_mode: str,
+    embed_dim: int,
+    hnsw_m: int,
+    hnsw_ef_construction: int,
+    concurrently: bool = False,
+) -> str:
+    """
+    Return the statement creating the HNSW index of a storage mode. The compact modes index
+    an expression over the float32 embeddings, so the table itself is never rewritten.
+    """
+    expression = {
+        "float32": "embedding vector_cosine_ops",
+        "halfvec": f"(embedding::halfvec({embed_dim})) halfvec_cosine_ops",
+        "binary": f"(binary_quantize(embedding)::bit({embed_dim})) bit_hamming_ops",
+    }[storage_mode]
+    return (
+        f"CREATE INDEX {'CONCURRENTLY ' if concurrently else ''}IF NOT EXISTS {embedding_index_name(table_name, storage_mode)} "
+        f"ON {schema_name}.{table_name} USING hnsw ({expression}) "
+        f"WITH (m = {hnsw_m}, ef_construction = {hnsw_ef_construction})"
+    )
+
+# Create QuantizedPGVectorStore class to search a compact HNSW index and rerank with full precision
+class QuantizedPGVectorStore(PGVectorStore):
+    """
+    PGVectorStore whose HNSW index can hold compact encodings of the embeddings.
+
+    In `halfvec` mode the index holds half precision vectors, in `binary` mode a single
+    bit per dimension. The table keeps the float32 embeddings: the index returns
+    `rerank_factor` times the requested number of candidates, which are then reranked
+    by their exact cosine distance. The `float32` mode behaves as PGVectorStore.
+
+    With a replica attached, the queries it can answer are served from memory instead.
+    """
+
+    storage_mode: str = "float32"
+    rerank_factor: int = 4
+
+    _replica: Any = PrivateAttr(default=None)
+
+    @classmethod
+    def from_params(
+        cls,
+        *args: Any,
+        storage_mode: str = "float32",
+        rerank_factor: Optional[int] = None,
+        **kwargs: Any,
+    ) -> "QuantizedPGVectorStore":
+        if storage_mode not in VECTOR_STORAGE_MODES:
+            raise ValueError(f"Unknown vector storage mode '{storage_mode}', expected one of {', '.join(VECTOR_STORAGE_MODES)}.")
+        store = super().from_params(*args, **kwargs)
+        # The store connects lazily, so the mode is set before its index is created
+        store.storage_mode = storage_mode
+        store.rerank_factor = rerank_factor or default_rerank_factor(storage_mode)
+        return store
+
+    def attach_replica(self, replica: Any) -> None:
+        """Serve queries from an in-process replica of the table (see replica.py), when it can answer them."""
+        self._replica = replica
+
+    def query(self, query: VectorStoreQuery, **kwargs: Any) -> VectorStoreQueryResult:
+        if self._replica is not None:
+            rows = self._replica.query(query)
+            if rows is not None:
+                return self._db_rows_to_query_result(rows)
+        return super().query(query, **kwargs)
+
+    def _create_hnsw_index(self) -> None:
+        if self.storage_mode == "float32":
+            return super()._create_hnsw_index()
+        if "hnsw_ef_construction" not in self.hnsw_kwargs or "hnsw_m" not in self.hnsw_kwargs:
+            raise ValueError("Make sure hnsw_ef_search, hnsw_ef_construction, and hnsw_m are in hnsw_kwargs.")
+        # Consume the build parameters as PGVectorStore does, leaving hnsw_ef_search
+        hnsw_m = self.hnsw_kwargs.pop("hnsw_m")
+        hnsw_ef_construction = self.hnsw_kwargs.pop("hnsw_ef_construction")
+        self.hnsw_kwargs.pop("hnsw_dist_method", None)
+        with self._session() as session, session.begin():
+            session.execute(text(embedding_index_statement(
+                self.schema_name,
+                self._table_class.__tablename__,
+                self.storage_mode,
+                self.embed_dim,
+                hnsw_m,
+                hnsw_ef_construction,
+            )))
+
+    def _build_query(
+        self,
+        embedding: Optional[List[float]],
+        limit: int = 10,
+        metadata_filters: Optional[MetadataFilters] = None,
+    ) -> Any:
+        # Without a limit every row is returned, so there are no candidates to rerank
+        if self.storage_mode == "float32" or limit is None:
+            return super()._build_query(embedding, limit, metadata_filters)
+
+        table = self._table_class
+        query_embedding = bindparam("query_embedding", embedding, type_=Vector(self.embed_dim))
+        # The parameter is sent untyped, and binary_quantize() is overloaded for vector and
+        # halfvec, so the query embedding is cast before quantizing it
+        if self.storage_mode == "halfvec":
+            candidate_distance = cast(table.embedding, HALFVEC(self.embed_dim)).cosine_distance(
+                cast(query_embedding, HALFVEC(self.embed_dim))
+            )
+        else:
+            candidate_distance = cast(func.binary_quantize(table.embedding), BIT(self.embed_dim)).hamming_distance(
+                cast(func.binary_quantize(cast(query_embedding, Vector(self.embed_dim))), BIT(self.embed_dim))
+            )
+
+        # The ordering must match the index expression for the planner to use the index
+        candidates = self._apply_filters_and_limit(
+            select(table.id, table.node_id, table.text, table.metadata_, table.embedding).order_by(candidate_distance),
+            limit * self.rerank_factor,
+            metadata_filters,
+        ).subquery("candidates")
+        return select(
+            candidates.c.id,
+            candidates.c.node_id,
+            candidates.c.text,
+            candidates.c.metadata_,
+            candidates.c.embedding.cosine_distance(query_embedding).label("distance"),
+        ).order_by(text("distance asc")).limit(limit)
+
+    def _candidate_kwargs(self, limit: Optional[int], kwargs: dict) -> dict:
+        """
+        Widen the HNSW search to at least the number of candidates to rerank, since an
+        index scan returns no more than `hnsw.ef_search` rows.
+        """
+        if self.storage_mode != "float32" and self.hnsw_kwargs and limit is not None:
+            hnsw_ef_search = kwargs.get("hnsw_ef_search") or self.hnsw_kwargs["hnsw_ef_search"]
+            kwargs = {**kwargs, "hnsw_ef_search": min(max(hnsw_ef_search, limit * self.rerank_factor), HNSW_MAX_EF_SEARCH)}
+        return kwargs
+
+    def _query_with_score(
+        self,
+        embedding: Optional[List[float]],
+        limit: int = 10,
+        metadata_filters: Optional[MetadataFilters] = None,
+        **kwargs: Any,
+    ) -> Any:
+        return super()._query_with_score(embedding, limit, metadata_filters, **self._candidate_kwargs(limit, kwargs))
+
+    async def _aquery_with_score(
+        self,
+        embedding: Optional[List[float]],
+        limit: int = 10,
+        metadata_filters: Optional[MetadataFilters] = None,
+        **kwargs: Any,
+    ) -> Any:
+        return await super()._aquery_with_score(embedding, limit, metadata_filters, **self._candidate_kwargs(limit, kwargs))
@@ -0,0 +1,105 @@
+import argparse
+import os
+import statistics
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# Import the admission module on its own, without initializing the API app and its LLM clients
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "app"))
+from admission import AdmissionController, AdmissionError, CircuitBreaker, DeadlineExceededError  # noqa: E402
+
+class FakeProvider:
+    """
+    Simulated LLM API: serves `capacity` calls at once, queues the rest on its side,
+    and answers `429 Too Many Requests` once more than `rate_limit` calls are outstanding.
+    """
+
+    def __init__(self, latency: float, capacity: int, rate_limit: int):
+        self.latency = latency
+        self.rate_limit = rate_limit
+        self._capacity = threading.Semaphore(capacity)
+        self._lock = threading.Lock()
+        self.outstanding = 0
+
+    def complete(self, prompt: str) -> str:
+        with self._lock:
+            if self.outstanding >= self.rate_limit:
+                raise RuntimeError("429 Too Many Requests")
+            self.outstanding += 1
+        try:
+            with self._capacity:
+                time.sleep(self.latency)
+            return f"Answer to {prompt}"
+        finally:
+            with self._lock:
+                self.outstanding -= 1
+
+def run(call, requests: int, workers: int, interval: float) -> dict[str, list[float]]:
+    """Fire `requests` calls at a fixed arrival rate from `workers` server threads, and collect the latencies per outcome."""
+    latencies = {"ok": [], "rejected": [], "timeout": [], "error": []}
+    lock = threading.Lock()
+
+    def request(i: int):
+        start_time = time.perf_counter()
+        try:
+            call(f"question {i}")
+            outcome = "ok"
+        except DeadlineExceededError:
+            outcome = "timeout"
+        except AdmissionError:
+            outcome = "rejected"
+        except Exception:
+            outcome = "error"
+        with lock:
+            latencies[outcome].append(time.perf_counter() - start_time)
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for i in range(requests):
+            pool.submit(request, i)
+            time.sleep(interval)
+    return latencies
+
+def percentile(values: list[float], q: int) -> float:
+    if not values:
+        return float("nan")
+    return statistics.quantiles(values, n=100, method="inclusive")[q - 1] if len(values) > 1 else values[0]
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare tail latency of bursts of LLM calls made directly and through the admission controller, against a simulated provider.")
+    parser.add_argument("--requests", type=int, default=400, help="Number of calls in the burst.")
+    parser.add_argument("--rate", type=float, default=40.0, help="Arrival rate of the calls, per second.")
+    parser.add_argument("--workers", type=int, default=40, help="Number of server threads (the FastAPI threadpool has 40).")
+    parser.add_argument("--latency", type=float, default=0.2, help="Provider latency of a single call, in seconds.")
+    parser.add_argument("--capacity", type=int, default=4, help="Number of calls the provider serves at once.")
+    parser.add_argument("--rate-limit", type=int, default=16, help="Number of outstanding calls above which the provider answers 429.")
+    parser.add_argument("--max-concurrency", type=int, default=4, help="Admission controller concurrency.")
+    parser.add_argument("--max-queue", type=int, default=8, help="Admission controller queue size.")
+    parser.add_argument("--timeout", type=float, default=30.0, help="Admission controller deadline, in seconds.")
+    args = parser.parse_args()
+
+    # Latency percentiles are over the answered calls, failed calls are counted separately
+    print(f"{'mode':<10} {'p50 s':>7} {'p95 s':>7} {'p99 s':>7} {'max s':>7} {'ok':>5} {'rejected':>8} {'timeout':>7} {'error':>5} {'fail p99 s':>10}")
+    for mode in ["direct", "admission"]:
+        provider = FakeProvider(args.latency, args.capacity, args.rate_limit)
+        if mode == "direct":
+            call = provider.complete
+        else:
+            controller = AdmissionController(
+                name="llm",
+                max_concurrency=args.max_concurrency,
+                max_queue=args.max_queue,
+                timeout=args.timeout,
+                breaker=CircuitBreaker(),
+            )
+            call = lambda prompt: controller.call(provider.complete, prompt)  # noqa: E731
+        latencies = run(call, args.requests, args.workers, 1 / args.rate)
+        answered = latencies["ok"]
+        failed = latencies["rejected"] + latencies["timeout"] + latencies["error"]
+        print(
+            f"{mode:<10} {percentile(answered, 50):>7.2f} {percentile(answered, 95):>7.2f} "
+            f"{percentile(answered, 99):>7.2f} {max(answered, default=float('nan')):>7.2f} {len(answered):>5} "
+            f"{len(latencies['rejected']):>8} {len(latencies['timeout']):>7} {len(latencies['error']):>5} "
+            f"{percentile(failed, 99):>10.2f}"
+        )
@@ -0,0 +1,100 @@
+import argparse
+import os
+import re
+import statistics
+import sys
+import time
+from datetime import date, datetime, timedelta
+from sqlalchemy import create_engine, text
+
+# Import the schema module on its own, without initializing the API app and its LLM clients
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "app"))
+from schema import upgrade_schema, ensure_partitions, month_start, add_months  # noqa: E402
+
+# Dashboard-style analytics queries over a recent window
+QUERIES = {
+    "llm-response-metrics (7 days)": (
+        "SELECT count(*) FILTER (WHERE success), count(*), avg(latency) FROM {table} "
+        "WHERE timestamp >= :start AND timestamp <= :end",
+        7,
+    ),
+    "query-log-volume (30 days)": (
+        "SELECT count(*) FROM {table} WHERE timestamp >= :start AND timestamp <= :end",
+        30,
+    ),
+}
+
+def reset(engine):
+    """Drop the query log tables of the benchmark database and recreate them partitioned."""
+    with engine.begin() as connection:
+        connection.execute(text("DROP TABLE IF EXISTS cited_documents, query_logs, query_logs_flat CASCADE"))
+        connection.execute(text("DROP SEQUENCE IF EXISTS cited_documents_id_seq, query_logs_id_seq"))
+    upgrade_schema(engine)
+    with engine.begin() as connection:
+        connection.execute(text("CREATE TABLE query_logs_flat (LIKE query_logs INCLUDING DEFAULTS)"))
+        connection.execute(text("CREATE INDEX query_logs_flat_timestamp_idx ON query_logs_flat (timestamp)"))
+
+def seed(engine, first_month: date, last_month: date, rows_per_month: int):
+    """Insert random query logs for the given months into both the partitioned and the flat table."""
+    start = datetime.combine(first_month, datetime.min.time())
+    end = datetime.combine(add_months(last_month, 1), datetime.min.time())
+    months = (last_month.year - first_month.year) * 12 + last_month.month - first_month.month + 1
+    with engine.begin() as connection:
+        ensure_partitions(connection, first_month, last_month)
+        connection.execute(text(
+            "INSERT INTO query_logs (query, response, latency, success, error, timestamp) "
+            "SELECT 'question ' || g, 'answer ' || g, random() * 5, random() > 0.1, NULL, "
+            "CAST(:start AS timestamp) + random() * (CAST(:end AS timestamp) - CAST(:start AS timestamp)) "
+            "FROM generate_series(1, :rows) g"
+        ), {"start": start, "end": end, "rows": rows_per_month * months})
+        connection.execute(text(
+            "INSERT INTO query_logs_flat SELECT * FROM query_logs WHERE timestamp >= :start AND timestamp < :end"
+        ), {"start": start, "end": end})
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+        connection.execute(text("VACUUM ANALYZE query_logs"))
+        connection.execute(text("VACUUM ANALYZE query_logs_flat"))
+
+def time_query(engine, statement: str, params: dict, repeats: int) -> float:
+    """Return the median execution time of a statement, in milliseconds."""
+    timings = []
+    with engine.connect() as connection:
+        connection.execute(text(statement), params).all()  # Warm up
+        for _ in range(repeats):
+            start_time = time.perf_counter()
+            connection.execute(text(statement), params).all()
+            timings.append((time.perf_counter() - start_time) * 1000)
+    return statistics.median(timings)
+
+def scanned_partitions(engine, statement: str, params: dict) -> int:
+    """Count the partitions a statement scans after pruning."""
+    with engine.connect() as connection:
+        plan = connection.execute(text(f"EXPLAIN {statement}"), params).scalars().all()
+    return len({match for line in plan for match in re.findall(r"on (query_logs_\d{4}_\d{2})\b", line)})
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark analytics queries on partitioned query logs as the history grows. Drops and recreates the query log tables, so use a disposable database.")
+    parser.add_argument("connection_string", help="Connection string of a disposable benchmark database.")
+    parser.add_argument("--history-months", default="3,6,12,24", help="Comma separated history lengths to benchmark, in months.")
+    parser.add_argument("--rows-per-month", type=int, default=200000, help="Number of query logs per month.")
+    parser.add_argument("--repeats", type=int, default=20, help="Number of timed executions per query.")
+    args = parser.parse_args()
+
+    engine = create_engine(args.connection_string)
+    reset(engine)
+
+    this_month = month_start(date.today())
+    seeded_months = 0
+    print(f"{'months':>6} {'rows':>10} {'query':<32} {'partitioned ms':>15} {'flat ms':>9} {'partitions':>10}")
+    for history in sorted(int(months) for months in args.history_months.split(",")):
+        # Grow the history backwards from the current month
+        seed(engine, add_months(this_month, -(history - 1)), add_months(this_month, -seeded_months), args.rows_per_month)
+        seeded_months = history
+
+        with engine.connect() as connection:
+            total_rows = connection.execute(text("SELECT count(*) FROM query_logs")).scalar()
+        for name, (statement, days) in QUERIES.items():
+            params = {"start": date.today() - timedelta(days=days), "end": date.today() + timedelta(days=1)}
+            partitioned = time_query(engine, statement.format(table="query_logs"), params, args.repeats)
+            flat = time_query(engine, statement.format(table="query_logs_flat"), params, args.repeats)
+            partitions = scanned_partitions(engine, statement.format(table="query_logs"), params)
+            print(f"{history:>6} {total_rows:>10} {name:<32} {partitioned:>15.2f} {flat:>9.2f} {partitions:>10}")
@@ -0,0 +1,220 @@
+import argparse
+import os
+import statistics
+import sys
+import time
+from datetime import date, datetime, timedelta
+from sqlalchemy import bindparam, create_engine, text
+
+# Import the schema module on its own, without initializing the API app and its LLM clients
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "app"))
+from schema import upgrade_schema, ensure_partitions, list_partition_months, month_start, add_months, QUERY_LOG_SEARCH_TEXT  # noqa: E402
+
+PRODUCTS = ["Arc A770", "Arc A750", "Core i9", "Core i7", "Core Ultra", "Xeon", "NUC", "Optane", "Wi-Fi 6E AX211", "Ethernet I225", "Thunderbolt 4", "Iris Xe"]
+ACTIONS = ["install", "update", "configure", "reset", "troubleshoot", "benchmark", "overclock", "uninstall"]
+SUBJECTS = ["driver", "firmware", "BIOS", "graphics settings", "power plan", "fan curve", "display output", "network adapter"]
+ERRORS = ["Timeout calling the LLM", "Rate limit exceeded", "Context window exceeded", "Invalid response format", "Connection reset by peer"]
+
+# Searches as a support engineer would type them, from very selective to very common
+SEARCHES = {
+    "error code (rare)": "E0042",
+    # A case number in about 0.35% of the logs: too rare for the timestamp index, too common to skip
+    "case number (uncommon)": "C20",
+    "product (common)": "Thunderbolt",
+    "phrase": '"fan curve" Xeon',
+    "misspelled (fuzzy)": "Thunderbolt firmwre",
+}
+
+# The statements of `/query-logs/` searches, including all logs, as the QueryLogs page does: the most
+# recent matches of each month, newest month first, then the logs of the page and their citations
+SEARCH_STATEMENT = (
+    "SELECT id, timestamp, ts_rank_cd(search_vector, websearch_to_tsquery('english', :search)) AS rank "
+    "FROM query_logs WHERE timestamp >= :start AND timestamp <= :end "
+    "AND search_vector @@ websearch_to_tsquery('english', :search) "
+    "AND timestamp >= :month AND timestamp < :next_month "
+    "ORDER BY timestamp DESC, id DESC LIMIT :candidates"
+)
+
+FUZZY_STATEMENT = (
+    f"SELECT id, timestamp, word_similarity(:search, {QUERY_LOG_SEARCH_TEXT}) AS rank "
+    f"FROM query_logs WHERE timestamp >= :start AND timestamp <= :end "
+    f"AND :search <% ({QUERY_LOG_SEARCH_TEXT}) "
+    f"AND timestamp >= :month AND timestamp < :next_month "
+    f"ORDER BY timestamp DESC, id DESC LIMIT :candidates"
+)
+
+PAGE_STATEMENT = "SELECT id, query, response, latency, success, error, prompt_tokens, timestamp FROM query_logs WHERE (id, timestamp) IN :keys"
+
+CITATIONS_STATEMENT = "SELECT file_path, node_id, score, query_log_id, timestamp FROM cited_documents WHERE (query_log_id, timestamp) IN :keys ORDER BY id"
+
+# What finding logs looked like before the search index: a substring scan
+SCAN_STATEMENT = (
+    "SELECT id, query, timestamp FROM query_logs WHERE timestamp >= :start AND timestamp <= :end "
+    "AND (query ILIKE :pattern OR error ILIKE :pattern OR response ILIKE :pattern) "
+    "ORDER BY timestamp DESC, id DESC LIMIT :k"
+)
+
+def array(values: list[str]) -> str:
+    return "ARRAY[" + ", ".join("'" + value.replace("'", "''") + "'" for value in values) + "]"
+
+def pick(values: list[str]) -> str:
+    return f"({array(values)})[1 + floor(random() * {len(values)})::int]"
+
+def reset(engine):
+    """Drop the query log tables of the benchmark database and recreate them."""
+    with engine.begin() as connection:
+        connection.execute(text("DROP TABLE IF EXISTS cited_documents, query_logs CASCADE"))
+        connection.execute(text("DROP SEQUENCE IF EXISTS cited_documents_id_seq, query_logs_id_seq"))
+    upgrade_schema(engine)
+
+def seed(engine, months: int, rows: int, batch_size: int):
+    """
+    Insert `rows` synthetic query logs spread over the last `months` months, in batches.
+    The logs are inserted in time order, as the API appends them, so the heap of each
+    partition is ordered by timestamp as in production.
+    """
+    first_month = add_months(month_start(date.today()), -(months - 1))
+    start = datetime.combine(first_month, datetime.min.time())
+    end = datetime.now()
+    with engine.begin() as connection:
+        ensure_partitions(connection, first_month, month_start(date.today()))
+    statement = text(
+        f"INSERT INTO query_logs (query, response, latency, success, error, timestamp) "
+        # Case numbers follow a long tail, like the model numbers and error messages of real questions
+        f"SELECT 'How do I ' || {pick(ACTIONS)} || ' the ' || {pick(SUBJECTS)} || ' of my ' || {pick(PRODUCTS)} || '? '"
+        f"|| '(case C' || floor(exp(random() * ln(1000000)))::int || ')', "
+        f"'To ' || {pick(ACTIONS)} || ' the ' || {pick(SUBJECTS)} || ', open the ' || {pick(PRODUCTS)} || ' support page and follow the steps.', "
+        f"random() * 5, failed IS NULL, "
+        f"CASE WHEN failed IS NOT NULL THEN {pick(ERRORS)} || ' (E' || lpad(floor(random() * 10000)::text, 4, '0') || ')' END, "
+        f"CAST(:start AS timestamp) + (:offset + g - random()) / :total * (CAST(:end AS timestamp) - CAST(:start AS timestamp)) "
+        f"FROM (SELECT g, CASE WHEN random() < 0.1 THEN true END AS failed FROM generate_series(1, :rows) g) s "
+        f"ORDER BY g"
+    )
+    inserted = 0
+    while inserted < rows:
+        count = min(batch_size, rows - inserted)
+        with engine.begin() as connection:
+            connection.execute(statement, {"start": start, "end": end, "rows": count, "offset": inserted, "total": rows})
+        inserted += count
+        print(f"Seeded {inserted} / {rows} query logs", end="\r")
+    print()
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+        connection.execute(text("VACUUM ANALYZE query_logs"))
+
+def seed_citations(engine, citations: int, batch_size: int):
+    """Insert `citations` synthetic cited documents per successful query log, a month at a time."""
+    statement = text(
+        f"INSERT INTO cited_documents (file_path, node_id, score, query_log_id, timestamp) "
+        f"SELECT 'docs/' || {pick(PRODUCTS)} || '/' || {pick(SUBJECTS)} || '.md', md5(random()::text), random(), id, timestamp "
+        f"FROM query_logs, generate_series(1, :citations) "
+        f"WHERE success AND timestamp >= :month AND timestamp < :next_month AND id >= :first AND id < :first + :batch_size "
+        f"ORDER BY timestamp, id"
+    )
+    with engine.connect() as connection:
+        months = list_partition_months(connection, "query_logs")
+    for month in months:
+        with engine.connect() as connection:
+            first, last = connection.execute(
+                text("SELECT min(id), max(id) FROM query_logs WHERE timestamp >= :month AND timestamp < :next_month"),
+                {"month": month, "next_month": add_months(month, 1)},
+            ).one()
+        for start in range(first or 0, (last or -1) + 1, batch_size):
+            with engine.begin() as connection:
+                connection.execute(statement, {"citations": citations, "month": month, "next_month": add_months(month, 1), "first": start, "batch_size": batch_size})
+        print(f"Seeded the citations of {month:%Y-%m}", end="\r")
+    print()
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+        connection.execute(text("VACUUM ANALYZE cited_documents"))
+
+def time_statement(engine, statement: str, params: dict, repeats: int) -> tuple[float, float, int]:
+    """Return the median and maximum execution time of a statement in milliseconds, and its row count."""
+    timings = []
+    with engine.connect() as connection:
+        rows = len(connection.execute(text(statement), params).all())  # Warm up
+        for _ in range(repeats):
+            start_time = time.perf_counter()
+            connection.execute(text(statement), params).all()
+            timings.append((time.perf_counter() - start_time) * 1000)
+    return statistics.median(timings), max(timings), rows
+
+def time_search(engine, statement: str, params: dict, repeats: int) -> tuple[float, float, int]:
+    """
+    Return the median and maximum time of a search as `/query-logs/` runs it in milliseconds, and its
+    row count: the most recent matches month by month, then the page and the citations of its logs.
+    """
+    start_month = month_start(params["start"])
+    with engine.connect() as connection:
+        months = [month for month in list_partition_months(connection, "query_logs") if start_month <= month <= params["end"]]
+
+    def search(connection) -> int:
+        limit = max(params["candidates"], params["offset"] + params["k"])
+        candidates = []
+        for month in reversed(months):
+            candidates += connection.execute(text(statement), {
+                **params, "month": month, "next_month": add_months(month, 1), "candidates": limit - len(candidates)
+            }).all()
+            if len(candidates) >= limit:
+                break
+        candidates.sort(key=lambda candidate: (candidate.rank, candidate.timestamp, candidate.id), reverse=True)
+        keys = [(candidate.id, candidate.timestamp) for candidate in candidates[params["offset"]:params["offset"] + params["k"]]]
+        if keys:
+            connection.execute(text(PAGE_STATEMENT).bindparams(bindparam("keys", expanding=True)), {"keys": keys}).all()
+            connection.execute(text(CITATIONS_STATEMENT).bindparams(bindparam("keys", expanding=True)), {"keys": keys}).all()
+        return len(keys)
+
+    timings = []
+    with engine.connect() as connection:
+        rows = search(connection)  # Warm up
+        for _ in range(repeats):
+            start_time = time.perf_counter()
+            search(connection)
+            timings.append((time.perf_counter() - start_time) * 1000)
+    return statistics.median(timings), max(timings), rows
+
+def has_trigram(engine) -> bool:
+    with engine.connect() as connection:
+        return connection.execute(text("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")).scalar() is not None
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark ranked search over query logs. Drops and recreates the query log tables, so use a disposable database.")
+    parser.add_argument("connection_string", help="Connection string of a disposable benchmark database.")
+    parser.add_argument("--rows", type=int, default=20000000, help="Number of query logs to seed.")
+    parser.add_argument("--months", type=int, default=12, help="Number of months the query logs are spread over.")
+    parser.add_argument("--batch-size", type=int, default=1000000, help="Number of query logs inserted per transaction.")
+    parser.add_argument("--citations", type=int, default=3, help="Number of citations seeded per successful query log.")
+    parser.add_argument("--days", type=int, default=None, help="Date window of the searches, in days. By default all logs, as the QueryLogs page searches.")
+    parser.add_argument("--k", type=int, default=50, help="Page size of the searches, as the QueryLogs page requests.")
+    parser.add_argument("--offset", type=int, default=0, help="Offset of the page.")
+    parser.add_argument("--candidates", type=int, default=int(os.getenv("QUERY_LOG_SEARCH_CANDIDATES", 2000)), help="Number of most recent matches ranked by relevance.")
+    parser.add_argument("--repeats", type=int, default=10, help="Number of timed executions per search.")
+    parser.add_argument("--skip-seed", action="store_true", help="Reuse the query logs seeded by a previous run.")
+    parser.add_argument("--scan", action="store_true", help="Also time an unindexed ILIKE scan for comparison (slow).")
+    args = parser.parse_args()
+
+    engine = create_engine(args.connection_string)
+    if not args.skip_seed:
+        reset(engine)
+        seed(engine, args.months, args.rows, args.batch_size)
+        seed_citations(engine, args.citations, args.batch_size)
+
+    with engine.connect() as connection:
+        total_rows = connection.execute(text("SELECT count(*) FROM query_logs")).scalar()
+    print(f"{total_rows} query logs, {f'{args.days} day window' if args.days else 'all logs'}, page size {args.k}, offset {args.offset}")
+    print(f"{'search':<22} {'mode':<10} {'median ms':>10} {'max ms':>8} {'rows':>5}")
+
+    # Without dates, `/query-logs/` searches from 1970 to the end of today
+    start = date.today() - timedelta(days=args.days) if args.days else date(1970, 1, 1)
+    params = {"start": start, "end": date.today() + timedelta(days=1), "k": args.k, "offset": args.offset, "candidates": args.candidates}
+    trigram = has_trigram(engine)
+    for name, search in SEARCHES.items():
+        modes = {"fuzzy": FUZZY_STATEMENT} if "fuzzy" in name else {"full-text": SEARCH_STATEMENT}
+        if args.scan:
+            modes["scan"] = SCAN_STATEMENT
+        for mode, statement in modes.items():
+            if mode == "fuzzy" and not trigram:
+                print(f"{name:<22} {mode:<10} {'skipped, pg_trgm is not installed':>25}")
+                continue
+            pattern = "%" + search.strip('"').split('"')[0] + "%"
+            timer = time_statement if mode == "scan" else time_search
+            median, maximum, rows = timer(engine, statement, {**params, "search": search, "pattern": pattern}, args.repeats)
+            print(f"{name:<22} {mode:<10} {median:>10.1f} {maximum:>8.1f} {rows:>5}")
@@ -0,0 +1,172 @@
+import argparse
+import io
+import os
+import re
+import statistics
+import sys
+import time
+import numpy as np
+from llama_index.core.vector_stores.types import VectorStoreQuery, VectorStoreQueryMode
+from sqlalchemy import create_engine, text
+
+# Import the vector store modules on their own, without initializing the API app and its LLM clients
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "app"))
+from vector_store import QuantizedPGVectorStore, HNSW_KWARGS, embedding_index_statement  # noqa: E402
+from replica import VectorReplica, SPARSE_RANKINGS, bump_version  # noqa: E402
+
+TABLE_NAME = "vector_replica_benchmark"
+
+PRODUCTS = ["Arc A770", "Arc A750", "Core i9", "Core i7", "Core Ultra", "Xeon", "NUC", "Optane", "Wi-Fi 6E AX211", "Ethernet I225", "Thunderbolt 4", "Iris Xe"]
+ACTIONS = ["install", "update", "configure", "reset", "troubleshoot", "benchmark", "overclock", "uninstall"]
+SUBJECTS = ["driver", "firmware", "BIOS", "graphics settings", "power plan", "fan curve", "display output", "network adapter"]
+
+def make_chunks(rows: int, dim: int, rng: np.random.Generator, start: int = 0) -> tuple[list[str], np.ndarray]:
+    """Generate support document chunks, and embeddings clustered around their product."""
+    topics = np.random.default_rng(0).standard_normal((len(PRODUCTS), dim)).astype(np.float32)
+    products = rng.integers(len(PRODUCTS), size=rows)
+    # Knowledge base articles are referenced with a long tail, like error codes, so some terms are rare
+    articles = np.minimum(rng.zipf(1.3, size=(rows, 3)), 100000)
+    texts = [
+        f"Chunk {start + i}: to {ACTIONS[rng.integers(len(ACTIONS))]} the {SUBJECTS[rng.integers(len(SUBJECTS))]} "
+        f"of the {PRODUCTS[product]}, open the support page and follow steps {rng.integers(1, 100)} to {rng.integers(100, 200)}. "
+        f"See also KB{articles[i, 0]}, KB{articles[i, 1]} and KB{articles[i, 2]}."
+        for i, product in enumerate(products)
+    ]
+    embeddings = topics[products] + 1.5 * rng.standard_normal((rows, dim)).astype(np.float32)
+    return texts, embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True)
+
+def insert(engine, texts: list[str], embeddings: np.ndarray, start: int):
+    """Copy chunks into the benchmark table, with their number as node id."""
+    buffer = io.StringIO()
+    for i, (content, embedding) in enumerate(zip(texts, embeddings)):
+        buffer.write(f"{start + i}\t{content}\t{{}}\t[{','.join(f'{value:.7g}' for value in embedding)}]\n")
+    buffer.seek(0)
+    connection = engine.raw_connection()
+    try:
+        with connection.cursor() as cursor:
+            cursor.copy_expert(f"COPY public.data_{TABLE_NAME} (node_id, text, metadata_, embedding) FROM STDIN", buffer)
+        connection.commit()
+    finally:
+        connection.close()
+
+def timed(call) -> tuple[object, float]:
+    start_time = time.perf_counter()
+    result = call()
+    return result, (time.perf_counter() - start_time) * 1000
+
+def percentile(values: list[float], q: int) -> float:
+    return statistics.quantiles(values, n=100, method="inclusive")[q - 1]
+
+def same_ranking(expected: list[tuple[str, float]], actual: list[tuple[str, float]]) -> bool:
+    """
+    Whether two lists of (id, score) rank the same rows with the same scores. Postgres
+    orders tied rows arbitrarily, and returns any of the rows tied with the lowest
+    score, so tied rows are compared as sets, and those of the lowest score by score only.
+    """
+    # Postgres returns ts_rank in single precision
+    expected_scores, actual_scores = ([np.float32(score) for _, score in rows] for rows in (expected, actual))
+    lowest = min(expected_scores, default=None)
+    # After deduplication, hybrid results may keep a different number of the lowest tied rows
+    if set(actual_scores) != set(expected_scores) or (
+        [score for score in expected_scores if score != lowest] != [score for score in actual_scores if score != lowest]
+    ):
+        return False
+    return all(
+        {row[0] for row, score in zip(expected, expected_scores) if score == tied}
+        == {row[0] for row, score in zip(actual, actual_scores) if score == tied}
+        for tied in set(expected_scores) - {lowest}
+    )
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare the results and latency of retrieval from PGVectorStore and from the in-process replica. Creates its own table, so use a disposable database.")
+    parser.add_argument("connection_string", help="Connection string of a disposable benchmark database.")
+    parser.add_argument("--rows", type=int, default=5000, help="Number of chunks to seed.")
+    parser.add_argument("--dim", type=int, default=768, help="Dimensions of the embeddings.")
+    parser.add_argument("--queries", type=int, default=200, help="Number of queries per mode.")
+    parser.add_argument("--k", type=int, default=5, help="Number of chunks retrieved, as similarity_top_k.")
+    parser.add_argument("--added", type=int, default=100, help="Number of chunks added, and removed, before the incremental refresh.")
+    parser.add_argument("--hnsw", action="store_true", help="Search Postgres through an HNSW index, as the API does, instead of exactly.")
+    parser.add_argument("--sparse-ranking", choices=SPARSE_RANKINGS, default="ts_rank", help="Ranking of the replica's sparse results.")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed of the synthetic chunks.")
+    args = parser.parse_args()
+
+    engine = create_engine(args.connection_string)
+    rng = np.random.default_rng(args.seed)
+    table_name = f"data_{TABLE_NAME}"
+
+    with engine.begin() as connection:
+        connection.execute(text(f"DROP TABLE IF EXISTS public.{table_name}"))
+    store = QuantizedPGVectorStore.from_params(
+        connection_string=engine.url,
+        async_connection_string=engine.url.set(drivername="postgresql+asyncpg"),
+        table_name=TABLE_NAME,
+        embed_dim=args.dim,
+        hybrid_search=True,
+    )
+    store._initialize()
+    # Set after the setup, which would otherwise build the index before seeding
+    store.hnsw_kwargs = {"hnsw_ef_search": HNSW_KWARGS["hnsw_ef_search"]} if args.hnsw else None
+    texts, embeddings = make_chunks(args.rows, args.dim, rng)
+    insert(engine, texts, embeddings, 0)
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+        if args.hnsw:
+            connection.execute(text(embedding_index_statement("public", table_name, "float32", args.dim, HNSW_KWARGS["hnsw_m"], HNSW_KWARGS["hnsw_ef_construction"])))
+        connection.execute(text(f"VACUUM ANALYZE public.{table_name}"))
+    bump_version(engine, table_name)
+
+    # The replica of the benchmark only refreshes when told to
+    replica = VectorReplica(engine, table_name, args.dim, refresh_interval=float("inf"), sparse_ranking=args.sparse_ranking)
+    _, load_ms = timed(lambda: replica.refresh(force=True))
+    stats = replica.stats()
+    print(f"{args.rows} chunks of {args.dim} dimensions, {'HNSW' if args.hnsw else 'exact'} Postgres search, k={args.k}")
+    print(f"Replica loaded in {load_ms:.0f} ms: {stats['embedding_bytes'] / 2**20:.1f} MB of embeddings, {stats['terms']} terms")
+    if args.hnsw:
+        print("The replica searches exactly, so the dense results it does not share with Postgres are misses of the HNSW index.")
+    if args.sparse_ranking == "bm25":
+        print("The sparse results are ranked by BM25 in the replica and by ts_rank in Postgres, so they mostly agree by overlap.")
+    print("Top-k agreement counts the queries with the same rows and scores, rows tied with the k-th score being interchangeable.")
+
+    picked = rng.integers(args.rows, size=args.queries)
+    query_embeddings = embeddings[picked] + 0.3 * rng.standard_normal((args.queries, args.dim)).astype(np.float32)
+    # A question about the chunk's subject and product, and one of its articles
+    query_strs = [
+        " ".join(texts[i].split()[3:6] + [re.search(r"of the (.+?), open", texts[i]).group(1), texts[i].split()[-3].rstrip(",")])
+        for i in picked
+    ]
+
+    print(f"{'mode':<8} {'source':<9} {'p50 ms':>7} {'p95 ms':>7} {'top-k agreement':>16} {'sparse overlap':>15}")
+    for mode in [VectorStoreQueryMode.DEFAULT, VectorStoreQueryMode.SPARSE, VectorStoreQueryMode.HYBRID]:
+        timings = {"postgres": [], "replica": []}
+        agreements, overlaps = 0, []
+        for embedding, query_str in zip(query_embeddings, query_strs):
+            query = VectorStoreQuery(query_embedding=embedding.tolist(), query_str=query_str, similarity_top_k=args.k, mode=mode)
+            store.attach_replica(None)
+            expected, postgres_ms = timed(lambda: store.query(query))
+            store.attach_replica(replica)
+            actual, replica_ms = timed(lambda: store.query(query))
+            timings["postgres"].append(postgres_ms)
+            timings["replica"].append(replica_ms)
+            # Hybrid results are the dense top-k followed by the new sparse results
+            dense = args.k if mode != VectorStoreQueryMode.SPARSE else 0
+            sparse = mode != VectorStoreQueryMode.DEFAULT
+            agreements += expected.ids[:dense] == actual.ids[:dense] and (not sparse or same_ranking(
+                list(zip(expected.ids[dense:], expected.similarities[dense:])),
+                list(zip(actual.ids[dense:], actual.similarities[dense:])),
+            ))
+            if sparse:
+                expected_sparse, actual_sparse = set(expected.ids[dense:]), set(actual.ids[dense:])
+                overlaps.append(len(expected_sparse & actual_sparse) / max(len(expected_sparse | actual_sparse), 1))
+        for source, values in timings.items():
+            overlap = f"{statistics.mean(overlaps):.2f}" if overlaps and source == "replica" else "-"
+            agreement = f"{agreements}/{args.queries}" if source == "replica" else "-"
+            print(f"{mode.value:<8} {source:<9} {percentile(values, 50):>7.2f} {percentile(values, 95):>7.2f} {agreement:>16} {overlap:>15}")
+
+    # Add and remove chunks as a document upload does, then refresh incrementally
+    added_texts, added_embeddings = make_chunks(args.added, args.dim, rng, start=args.rows)
+    insert(engine, added_texts, added_embeddings, args.rows)
+    with engine.begin() as connection:
+        connection.execute(text(f"DELETE FROM public.{table_name} WHERE id IN (SELECT id FROM public.{table_name} ORDER BY random() LIMIT :added)"), {"added": args.added})
+        rows = connection.execute(text(f"SELECT count(*) FROM public.{table_name}")).scalar()
+    bump_version(engine, table_name)
+    _, refresh_ms = timed(lambda: replica.refresh(force=True))
+    print(f"Incremental refresh of {args.added} added and {args.added} removed chunks in {refresh_ms:.0f} ms, replica rows {replica.stats()['rows']} / table rows {rows}")
@@ -0,0 +1,136 @@
+import argparse
+import io
+import os
+import statistics
+import sys
+import time
+import numpy as np
+from sqlalchemy import create_engine, text
+
+# Import the vector store module on its own, without initializing the API app and its LLM clients
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "app"))
+from vector_store import (  # noqa: E402
+    QuantizedPGVectorStore,
+    VECTOR_STORAGE_MODES,
+    HNSW_KWARGS,
+    default_rerank_factor,
+    embedding_index_name,
+    embedding_index_statement,
+    supports_storage_mode,
+)
+
+TABLE_NAME = "vector_storage_benchmark"
+
+def make_embeddings(rows: int, dim: int, n_queries: int, rng: np.random.Generator) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Generate unit length embeddings clustered around topics, as document chunks are, and
+    queries close to random documents.
+    """
+    topics = rng.standard_normal((max(rows // 100, 1), dim)).astype(np.float32)
+    embeddings = topics[rng.integers(len(topics), size=rows)] + 0.8 * rng.standard_normal((rows, dim)).astype(np.float32)
+    embeddings /= np.linalg.norm(embeddings, axis=1, keepdims=True)
+    queries = embeddings[rng.integers(rows, size=n_queries)] + 0.05 * rng.standard_normal((n_queries, dim)).astype(np.float32)
+    queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+    return embeddings, queries
+
+def seed(engine, store: QuantizedPGVectorStore, embeddings: np.ndarray, batch_size: int):
+    """Recreate the benchmark table and copy the embeddings into it, with their row number as node id."""
+    with engine.begin() as connection:
+        connection.execute(text(f"DROP TABLE IF EXISTS public.data_{TABLE_NAME}"))
+    store._initialize()
+    connection = engine.raw_connection()
+    try:
+        with connection.cursor() as cursor:
+            for start in range(0, len(embeddings), batch_size):
+                buffer = io.StringIO()
+                for i in range(start, min(start + batch_size, len(embeddings))):
+                    buffer.write(f"{i}\tchunk {i}\t{{}}\t[{','.join(f'{value:.7g}' for value in embeddings[i])}]\n")
+                buffer.seek(0)
+                cursor.copy_expert(f"COPY public.data_{TABLE_NAME} (node_id, text, metadata_, embedding) FROM STDIN", buffer)
+                print(f"Seeded {min(start + batch_size, len(embeddings))} / {len(embeddings)} embeddings", end="\r")
+        connection.commit()
+    finally:
+        connection.close()
+    print()
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+        connection.execute(text(f"VACUUM ANALYZE public.data_{TABLE_NAME}"))
+
+def build_index(engine, mode: str, dim: int, maintenance_work_mem: str) -> tuple[float, int]:
+    """Drop the benchmark indexes and build the index of a storage mode. Return its build time in seconds and size in bytes."""
+    table = f"data_{TABLE_NAME}"
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+        for other in VECTOR_STORAGE_MODES:
+            connection.execute(text(f"DROP INDEX IF EXISTS public.{embedding_index_name(table, other)}"))
+        connection.execute(text("SELECT set_config('maintenance_work_mem', :value, false)"), {"value": maintenance_work_mem})
+        start_time = time.perf_counter()
+        connection.execute(text(embedding_index_statement(
+            "public", table, mode, dim, HNSW_KWARGS["hnsw_m"], HNSW_KWARGS["hnsw_ef_construction"]
+        )))
+        build_time = time.perf_counter() - start_time
+        size = connection.execute(text(f"SELECT pg_relation_size('public.{embedding_index_name(table, mode)}')")).scalar()
+    return build_time, size
+
+def evaluate(store: QuantizedPGVectorStore, queries: np.ndarray, truth: np.ndarray, k: int) -> tuple[float, float, float]:
+    """Run the queries through the store. Return the recall@k against the exact neighbours and the p50 and p95 latencies in milliseconds."""
+    store._initialize()
+    store._query_with_score(queries[0].tolist(), k)  # Warm up
+    recalls, timings = [], []
+    for query, expected in zip(queries, truth):
+        start_time = time.perf_counter()
+        rows = store._query_with_score(query.tolist(), k)
+        timings.append((time.perf_counter() - start_time) * 1000)
+        recalls.append(len({int(row.node_id) for row in rows} & set(expected.tolist())) / k)
+    quantiles = statistics.quantiles(timings, n=100, method="inclusive")
+    return statistics.mean(recalls), quantiles[49], quantiles[94]
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare the HNSW index size, build time, recall@k and query latency of the vector storage modes. Creates its own table, so use a disposable database.")
+    parser.add_argument("connection_string", help="Connection string of a disposable benchmark database.")
+    parser.add_argument("--rows", type=int, default=100000, help="Number of embeddings to seed.")
+    parser.add_argument("--dim", type=int, default=768, help="Dimensions of the embeddings.")
+    parser.add_argument("--queries", type=int, default=200, help="Number of timed queries per mode.")
+    parser.add_argument("--k", type=int, default=5, help="Number of neighbours retrieved, as similarity_top_k.")
+    parser.add_argument("--modes", default=",".join(VECTOR_STORAGE_MODES), help="Comma separated storage modes to compare.")
+    parser.add_argument("--rerank-factor", type=int, help="Candidates reranked per neighbour. Defaults to the mode's default.")
+    parser.add_argument("--batch-size", type=int, default=10000, help="Number of embeddings copied per batch.")
+    parser.add_argument("--maintenance-work-mem", default="1GB", help="Memory for the index builds.")
+    parser.add_argument("--skip-seed", action="store_true", help="Reuse the table seeded by a previous run with the same --rows, --dim and seed.")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed of the synthetic embeddings.")
+    args = parser.parse_args()
+
+    engine = create_engine(args.connection_string)
+    async_connection_string = engine.url.set(drivername="postgresql+asyncpg")
+
+    def make_store(mode: str, perform_setup: bool = False) -> QuantizedPGVectorStore:
+        # The setup store creates the table without an index, the benchmark builds them itself
+        return QuantizedPGVectorStore.from_params(
+            connection_string=engine.url,
+            async_connection_string=async_connection_string,
+            table_name=TABLE_NAME,
+            embed_dim=args.dim,
+            perform_setup=perform_setup,
+            hnsw_kwargs=None if perform_setup else {"hnsw_ef_search": HNSW_KWARGS["hnsw_ef_search"]},
+            storage_mode=mode,
+            rerank_factor=args.rerank_factor,
+        )
+
+    embeddings, queries = make_embeddings(args.rows, args.dim, args.queries, np.random.default_rng(args.seed))
+    if not args.skip_seed:
+        seed(engine, make_store("float32", perform_setup=True), embeddings, args.batch_size)
+    truth = np.argsort(-(queries @ embeddings.T), axis=1)[:, :args.k]
+
+    with engine.connect() as connection:
+        pgvector_version = connection.execute(text("SELECT extversion FROM pg_extension WHERE extname = 'vector'")).scalar()
+        table_size = connection.execute(text(f"SELECT pg_total_relation_size('public.data_{TABLE_NAME}')")).scalar()
+    print(f"{args.rows} embeddings of {args.dim} dimensions, table {table_size / 2**20:.0f} MB, pgvector {pgvector_version}, k={args.k}")
+    print(f"{'mode':<8} {'rerank':>6} {'index MB':>9} {'build s':>8} {'recall@k':>9} {'p50 ms':>7} {'p95 ms':>7}")
+
+    for mode in args.modes.split(","):
+        if not supports_storage_mode(pgvector_version, mode):
+            print(f"{mode:<8} skipped, needs pgvector 0.7.0 or later")
+            continue
+        build_time, size = build_index(engine, mode, args.dim, args.maintenance_work_mem)
+        store = make_store(mode)
+        rerank = "-" if mode == "float32" else str(args.rerank_factor or default_rerank_factor(mode))
+        recall, p50, p95 = evaluate(store, queries, truth, args.k)
+        print(f"{mode:<8} {rerank:>6} {size / 2**20:>9.1f} {build_time:>8.1f} {recall:>9.3f} {p50:>7.1f} {p95:>7.1f}")
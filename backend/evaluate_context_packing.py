@@ -0,0 +1,73 @@
+import argparse
+import csv
+import statistics
+import time
+from app import ingestor, query_engine
+from app.context import count_prompt_tokens
+from app.db import QueryEngine
+
+def run_question(engine: QueryEngine, question: str) -> dict:
+    """Answer a question without logging it, and measure latency, prompt tokens and citations."""
+    start_time = time.time()
+    response = engine.query_engine.query(question)
+    latency = time.time() - start_time
+    return {
+        "latency": latency,
+        "prompt_tokens": count_prompt_tokens(question, response.source_nodes),
+        "cited_node_ids": {node.node.node_id for node in QueryEngine.get_cited_nodes(response)},
+    }
+
+def citation_overlap(a: set, b: set) -> float:
+    """Jaccard overlap of two sets of cited node IDs."""
+    if not a and not b:
+        return 1.0
+    return len(a & b) / len(a | b)
+
+def evaluate(questions: list[str]) -> list[dict]:
+    """Compare the packed context against the previous behavior (all top-k chunks) for each question."""
+    baseline_engine = QueryEngine(ingestor=ingestor, pack_context=False)
+    rows = []
+    for question in questions:
+        baseline = run_question(baseline_engine, question)
+        packed = run_question(query_engine, question)
+        rows.append({
+            "question": question,
+            "baseline_latency": baseline["latency"],
+            "packed_latency": packed["latency"],
+            "baseline_prompt_tokens": baseline["prompt_tokens"],
+            "packed_prompt_tokens": packed["prompt_tokens"],
+            "citation_overlap": citation_overlap(baseline["cited_node_ids"], packed["cited_node_ids"]),
+        })
+        print(
+            f"{rows[-1]['baseline_prompt_tokens']:>6} -> {rows[-1]['packed_prompt_tokens']:>6} tokens, "
+            f"{rows[-1]['baseline_latency']:.2f}s -> {rows[-1]['packed_latency']:.2f}s, "
+            f"overlap {rows[-1]['citation_overlap']:.2f}: {question}"
+        )
+    return rows
+
+def summarize(rows: list[dict]):
+    """Print mean latency, prompt tokens and citation overlap over all questions."""
+    for field in ["latency", "prompt_tokens"]:
+        baseline = statistics.mean(row[f"baseline_{field}"] for row in rows)
+        packed = statistics.mean(row[f"packed_{field}"] for row in rows)
+        change = (packed - baseline) / baseline * 100 if baseline else 0.0
+        print(f"Mean {field}: {baseline:.2f} -> {packed:.2f} ({change:+.1f}%)")
+    print(f"Mean citation overlap: {statistics.mean(row['citation_overlap'] for row in rows):.2f}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Evaluate token-budgeted context packing against the previous behavior.")
+    parser.add_argument("questions_path", nargs="?", default="questions.txt", help="File with one question per line.")
+    parser.add_argument("--output", help="Optional CSV file to write the per-question results to.")
+    args = parser.parse_args()
+
+    with open(args.questions_path) as f:
+        questions = [line.strip() for line in f if line.strip()]
+
+    rows = evaluate(questions)
+    summarize(rows)
+
+    if args.output:
+        with open(args.output, "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=list(rows[0].keys()))
+            writer.writeheader()
+            writer.writerows(rows)
@@ -0,0 +1,39 @@
+import argparse
+import os
+import sys
+from datetime import date
+from dotenv import load_dotenv
+from sqlalchemy import create_engine
+
+# Import the schema module on its own, without initializing the API app and its LLM clients
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "app"))
+from schema import upgrade_schema, apply_retention, ensure_partitions, month_start, add_months  # noqa: E402
+
+if __name__ == "__main__":
+    load_dotenv()
+
+    parser = argparse.ArgumentParser(description="Create upcoming query log partitions and apply the retention policy. Run it periodically, e.g. from cron.")
+    parser.add_argument("--months-ahead", type=int, default=int(os.getenv("PARTITION_MONTHS_AHEAD", 2)), help="Number of future monthly partitions to create.")
+    parser.add_argument("--retention-months", type=int, default=os.getenv("QUERY_LOG_RETENTION_MONTHS"), help="Keep this many full months besides the current one. Keeps everything if not set.")
+    parser.add_argument("--action", choices=["archive", "drop"], default=os.getenv("QUERY_LOG_RETENTION_ACTION", "archive"), help="Archive expired partitions before dropping them, or just drop them.")
+    parser.add_argument("--archive-dir", default=os.getenv("QUERY_LOG_ARCHIVE_DIR", "./archive"), help="Directory to write archived partitions to.")
+    parser.add_argument("--archive-format", choices=["csv", "parquet"], default=os.getenv("QUERY_LOG_ARCHIVE_FORMAT", "csv"), help="Format of archived partitions: gzipped csv, or parquet (requires pyarrow).")
+    args = parser.parse_args()
+
+    engine = create_engine(os.getenv("CONNECTION_STRING"))
+    upgrade_schema(engine)
+
+    this_month = month_start(date.today())
+    with engine.begin() as connection:
+        ensure_partitions(connection, this_month, add_months(this_month, args.months_ahead))
+    print(f"Partitions exist up to {add_months(this_month, args.months_ahead):%Y-%m}.")
+
+    if args.retention_months is not None:
+        removed = apply_retention(
+            engine,
+            retention_months=int(args.retention_months),
+            action=args.action,
+            archive_dir=args.archive_dir,
+            archive_format=args.archive_format,
+        )
+        print(f"Removed {len(removed)} expired partitions: {', '.join(removed) or '-'}")
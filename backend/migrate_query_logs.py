@@ -0,0 +1,105 @@
+import argparse
+import os
+import sys
+import time
+from typing import Optional
+from dotenv import load_dotenv
+from sqlalchemy import create_engine, text
+from sqlalchemy.engine import make_url
+
+# Import the schema module on its own, without initializing the API app and its LLM clients
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "app"))
+from schema import (  # noqa: E402
+    QUERY_LOG_INDEXES,
+    QUERY_LOG_TRIGRAM_INDEXES,
+    upgrade_schema,
+    list_partition_months,
+    partition_name,
+)
+
+def index_state(connection, index_name: str):
+    """Return whether an index is valid, or None if it does not exist."""
+    return connection.execute(text(
+        "SELECT indisvalid FROM pg_index WHERE indexrelid = to_regclass(:index_name)"
+    ), {"index_name": index_name}).scalar()
+
+def attached_index(connection, parent_index: str, partition: str) -> Optional[str]:
+    """Return the index of a partition attached to an index of the partitioned table, if any."""
+    return connection.execute(text(
+        "SELECT i.inhrelid::regclass::text FROM pg_inherits i JOIN pg_index x ON x.indexrelid = i.inhrelid "
+        "WHERE i.inhparent = to_regclass(:parent_index) AND x.indrelid = to_regclass(:partition)"
+    ), {"parent_index": parent_index, "partition": partition}).scalar()
+
+def backfill(connection, partition: str, batch_size: int) -> int:
+    """
+    Compute the search vectors missing from a partition, in batches of IDs, each committed on
+    its own so that no lock is held for long. Returns the number of query logs backfilled.
+    """
+    first, last = connection.execute(text(f"SELECT min(id), max(id) FROM {partition}")).one()
+    if first is None:
+        return 0
+    backfilled = 0
+    for start in range(first, last + 1, batch_size):
+        backfilled += connection.execute(text(
+            f"UPDATE {partition} SET search_vector = query_log_search_vector(query, error, response) "
+            f"WHERE id >= :start AND id < :end AND search_vector IS NULL"
+        ), {"start": start, "end": start + batch_size}).rowcount
+        if backfilled:
+            print(f"Backfilled {backfilled} query logs of {partition}", end="\r")
+    if backfilled:
+        print()
+    return backfilled
+
+def build_index(connection, parent_index: str, definition: str, partition: str):
+    """
+    Build the index of a partition without blocking writes, and attach it to the index of
+    the partitioned table, which becomes valid once every partition has its index attached.
+    """
+    if attached_index(connection, parent_index, partition):
+        return
+    index_name = f"{partition}_{parent_index.removeprefix('query_logs_')}"
+    # An interrupted concurrent build leaves an invalid index behind, which IF NOT EXISTS would keep
+    if index_state(connection, index_name) is False:
+        print(f"Dropping the invalid index {index_name} left by an interrupted build.")
+        connection.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {index_name}"))
+    start_time = time.perf_counter()
+    connection.execute(text(f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {index_name} ON {partition} USING {definition}"))
+    connection.execute(text(f"ALTER INDEX {parent_index} ATTACH PARTITION {index_name}"))
+    print(f"Index {index_name} ready in {time.perf_counter() - start_time:.1f}s.")
+
+if __name__ == "__main__":
+    load_dotenv()
+
+    parser = argparse.ArgumentParser(
+        description="Backfill the search vectors of existing query logs and build their indexes, partition by partition, "
+        "without blocking writes. New query logs are indexed as they are written; run this once after upgrading. "
+        "Safe to interrupt and run again."
+    )
+    parser.add_argument("--batch-size", type=int, default=10000, help="Number of query log IDs backfilled per transaction.")
+    parser.add_argument("--maintenance-work-mem", default="1GB", help="Memory for the index builds.")
+    args = parser.parse_args()
+
+    engine = create_engine(make_url(os.getenv("CONNECTION_STRING")).set(database=os.getenv("DB_NAME")))
+    # Creates the search vector column, its trigger and the indexes of the partitioned table, if missing
+    upgrade_schema(engine)
+
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+        connection.execute(text("SELECT set_config('maintenance_work_mem', :value, false)"), {"value": args.maintenance_work_mem})
+        indexes = dict(QUERY_LOG_INDEXES)
+        if connection.execute(text("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")).scalar() is not None:
+            indexes.update(QUERY_LOG_TRIGRAM_INDEXES)
+        else:
+            print("pg_trgm is not installed, so fuzzy search is not indexed.")
+
+        # The most recent logs are searched most, so their partitions are migrated first
+        for month in reversed(list_partition_months(connection, "query_logs")):
+            partition = partition_name("query_logs", month)
+            if backfill(connection, partition, args.batch_size):
+                # Reclaim the rows replaced by the backfill
+                connection.execute(text(f"VACUUM {partition}"))
+            for parent_index, definition in indexes.items():
+                build_index(connection, parent_index, definition, partition)
+        # Collect the statistics of the search vectors, at the statistics target set by upgrade_schema
+        connection.execute(text("ANALYZE query_logs"))
+        print("Every query log is indexed.")
@@ -0,0 +1,74 @@
+import argparse
+import os
+import sys
+import time
+from dotenv import load_dotenv
+from sqlalchemy import create_engine, text
+from sqlalchemy.engine import make_url
+
+# Import the vector store module on its own, without initializing the API app and its LLM clients
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "app"))
+from vector_store import (  # noqa: E402
+    VECTOR_STORAGE_MODES,
+    HNSW_KWARGS,
+    embedding_index_name,
+    embedding_index_statement,
+    supports_storage_mode,
+)
+
+def index_state(connection, index_name: str):
+    """Return whether an index is valid, or None if it does not exist."""
+    return connection.execute(text(
+        "SELECT indisvalid FROM pg_index WHERE indexrelid = to_regclass(:index_name)"
+    ), {"index_name": index_name}).scalar()
+
+if __name__ == "__main__":
+    load_dotenv()
+
+    parser = argparse.ArgumentParser(
+        description="Build the HNSW index of a vector storage mode over the support documents, without blocking writes. "
+        "Build the index, set VECTOR_STORAGE_MODE and restart the API, then run again with --drop-others."
+    )
+    parser.add_argument("--mode", choices=VECTOR_STORAGE_MODES, required=True, help="Storage mode to migrate to.")
+    parser.add_argument("--table", default="data_support_docs", help="Table of the support document embeddings.")
+    parser.add_argument("--schema", default="public", help="Schema of the table.")
+    parser.add_argument("--embed-dim", type=int, default=768, help="Dimensions of the embeddings.")
+    parser.add_argument("--maintenance-work-mem", default="1GB", help="Memory for the index build, which is much faster when the graph fits.")
+    parser.add_argument("--drop-others", action="store_true", help="Drop the indexes of the other storage modes, once the API uses the new one.")
+    args = parser.parse_args()
+
+    engine = create_engine(make_url(os.getenv("CONNECTION_STRING")).set(database=os.getenv("DB_NAME")))
+    index_name = embedding_index_name(args.table, args.mode)
+
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+        pgvector_version = connection.execute(text("SELECT extversion FROM pg_extension WHERE extname = 'vector'")).scalar()
+        if pgvector_version is None or not supports_storage_mode(pgvector_version, args.mode):
+            sys.exit(f"The {args.mode} storage mode needs pgvector 0.7.0 or later, the database has {pgvector_version or 'no pgvector'}.")
+
+        # An interrupted concurrent build leaves an invalid index behind, which IF NOT EXISTS would keep
+        if index_state(connection, f"{args.schema}.{index_name}") is False:
+            print(f"Dropping the invalid index {index_name} left by an interrupted build.")
+            connection.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {args.schema}.{index_name}"))
+
+        connection.execute(text("SELECT set_config('maintenance_work_mem', :value, false)"), {"value": args.maintenance_work_mem})
+        start_time = time.perf_counter()
+        connection.execute(text(embedding_index_statement(
+            args.schema,
+            args.table,
+            args.mode,
+            args.embed_dim,
+            HNSW_KWARGS["hnsw_m"],
+            HNSW_KWARGS["hnsw_ef_construction"],
+            concurrently=True,
+        )))
+        size = connection.execute(text("SELECT pg_size_pretty(pg_relation_size(to_regclass(:index_name)))"), {"index_name": f"{args.schema}.{index_name}"}).scalar()
+        print(f"Index {index_name} ready in {time.perf_counter() - start_time:.1f}s, {size}.")
+
+        if args.drop_others:
+            for mode in VECTOR_STORAGE_MODES:
+                if mode != args.mode:
+                    connection.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {args.schema}.{embedding_index_name(args.table, mode)}"))
+                    print(f"Dropped the {mode} index, if any.")
+        else:
+            print(f"Set VECTOR_STORAGE_MODE={args.mode} and restart the API, then run again with --drop-others to free the other indexes.")
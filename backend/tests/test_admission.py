@@ -0,0 +1,116 @@
+import os
+import sys
+import threading
+import time
+import pytest
+
+# Import the admission module on its own, without initializing the API app and its LLM clients
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app"))
+from admission import (  # noqa: E402
+    AdmissionController,
+    CircuitBreaker,
+    CircuitOpenError,
+    DeadlineExceededError,
+    QueueFullError,
+)
+
+def slow_llm(latency: float):
+    """A fake LLM call that takes `latency` seconds to answer."""
+    def complete(prompt: str) -> str:
+        time.sleep(latency)
+        return f"Answer to {prompt}"
+    return complete
+
+def burst(controller: AdmissionController, fn, calls: int) -> list[tuple[str, float, Exception]]:
+    """Start `calls` calls at once, and return the outcome, latency and error of each."""
+    results = []
+    lock = threading.Lock()
+    start = threading.Barrier(calls)
+
+    def request(i: int):
+        start.wait()
+        start_time = time.perf_counter()
+        try:
+            controller.call(fn, f"question {i}")
+            outcome, error = "ok", None
+        except Exception as e:
+            outcome, error = type(e).__name__, e
+        with lock:
+            results.append((outcome, time.perf_counter() - start_time, error))
+
+    threads = [threading.Thread(target=request, args=(i,)) for i in range(calls)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+def test_excess_calls_are_rejected_quickly():
+    controller = AdmissionController("llm", max_concurrency=2, max_queue=2, timeout=2.0, breaker=CircuitBreaker())
+    results = burst(controller, slow_llm(0.3), calls=10)
+
+    answered = [latency for outcome, latency, _ in results if outcome == "ok"]
+    rejected = [(latency, error) for outcome, latency, error in results if outcome == "QueueFullError"]
+    assert len(answered) == 4  # 2 running and 2 queued
+    assert len(rejected) == 6
+    for latency, error in rejected:
+        assert isinstance(error, QueueFullError)
+        assert latency < 0.1
+        assert error.retry_after >= 1
+    assert controller.stats()["rejected"] == 6
+
+def test_tail_latency_is_bounded_by_the_timeout():
+    timeout = 1.0
+    controller = AdmissionController("llm", max_concurrency=2, max_queue=4, timeout=timeout, breaker=CircuitBreaker(failure_threshold=100))
+    # The first 4 calls answer within 0.8s, the last 2 queued calls would take 1.2s
+    results = burst(controller, slow_llm(0.4), calls=12)
+
+    outcomes = [outcome for outcome, _, _ in results]
+    assert outcomes.count("ok") == 4
+    assert outcomes.count("DeadlineExceededError") == 2
+    assert outcomes.count("QueueFullError") == 6
+    assert all(latency <= timeout for outcome, latency, _ in results if outcome == "ok")
+    # Timed out calls give up at their deadline instead of waiting for the provider
+    assert max(latency for _, latency, _ in results) <= timeout + 0.1
+
+def test_breaker_opens_after_failures_and_half_opens_after_reset_timeout():
+    breaker = CircuitBreaker(failure_threshold=3, reset_timeout=0.2)
+    controller = AdmissionController("embedding", max_concurrency=2, max_queue=2, timeout=1.0, breaker=breaker)
+    calls = []
+
+    def failing(prompt: str):
+        calls.append(prompt)
+        raise RuntimeError("503 Service Unavailable")
+
+    for i in range(3):
+        with pytest.raises(RuntimeError):
+            controller.call(failing, f"question {i}")
+    assert breaker.state == CircuitBreaker.OPEN
+
+    # Open: calls are rejected without reaching the provider
+    with pytest.raises(CircuitOpenError) as error:
+        controller.call(failing, "rejected")
+    assert error.value.retry_after >= 1
+    assert len(calls) == 3
+
+    # After the reset timeout, a single trial call goes through
+    time.sleep(0.25)
+    breaker.before_call()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+    # A failed trial re-opens the breaker, a successful one closes it
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    time.sleep(0.25)
+    assert controller.call(slow_llm(0), "trial") == "Answer to trial"
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.consecutive_failures == 0
+
+def test_deadline_counts_as_breaker_failure():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=30)
+    controller = AdmissionController("llm", max_concurrency=1, max_queue=0, timeout=0.1, breaker=breaker)
+    with pytest.raises(DeadlineExceededError):
+        controller.call(slow_llm(0.3), "slow")
+    assert breaker.state == CircuitBreaker.OPEN
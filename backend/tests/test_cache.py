@@ -0,0 +1,78 @@
+import os
+import sys
+import time
+
+# Import the cache module on its own, without initializing the API app and its LLM clients
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app"))
+from cache import LRUCache, NodeContentCache  # noqa: E402
+
+def entry_size(key, value) -> int:
+    return LRUCache._entry_size(key, value)
+
+def test_least_recently_used_entries_are_evicted_first():
+    size = entry_size("a", "x" * 100)
+    cache = LRUCache(max_bytes=3 * size)
+    for key in "abc":
+        cache.put(key, "x" * 100)
+    assert cache.get("a") is not None  # "b" is now the least recently used
+
+    cache.put("d", "x" * 100)
+    assert cache.get("b") is None
+    assert all(cache.get(key) is not None for key in "acd")
+    assert cache.stats()["evictions"] == 1
+    assert cache.stats()["bytes"] <= cache.max_bytes
+
+def test_entries_expire_after_their_ttl():
+    cache = LRUCache(max_bytes=10_000, ttl=0.1)
+    cache.put("default", "value")
+    cache.put("longer", "value", ttl=30)
+    time.sleep(0.15)
+
+    assert cache.get("default") is None
+    assert cache.get("longer") == "value"
+    stats = cache.stats()
+    assert stats["entries"] == 1
+    assert stats["bytes"] == entry_size("longer", "value")
+
+def test_invalidate_document_drops_only_its_nodes():
+    cache = NodeContentCache(max_bytes=10_000)
+    cache.put("node-1", "first", ref_doc_id="doc-a")
+    cache.put("node-2", "second", ref_doc_id="doc-a")
+    cache.put("node-3", "third", ref_doc_id="doc-b")
+
+    cache.invalidate_document("doc-a")
+    found, missing = cache.get_many(["node-1", "node-2", "node-3"])
+    assert found == {"node-3": "third"}
+    assert missing == ["node-1", "node-2"]
+    assert cache.stats()["bytes"] == entry_size("node-3", "third")
+
+    # Invalidating a document with nothing cached is a no-op
+    cache.invalidate_document("doc-c")
+    assert cache.stats()["entries"] == 1
+
+def test_hit_ratio_and_byte_accounting():
+    cache = LRUCache(max_bytes=10_000)
+    cache.put("a", "x" * 10)
+    cache.put("b", "x" * 20)
+    cache.put("a", "x" * 30)  # Replacing an entry accounts for its new size only
+    assert cache.stats()["bytes"] == entry_size("a", "x" * 30) + entry_size("b", "x" * 20)
+
+    cache.get("a")
+    cache.get("b")
+    cache.get("missing")
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"]) == (2, 1)
+    assert stats["hit_ratio"] == 2 / 3
+
+    cache.clear()
+    assert cache.stats()["bytes"] == 0
+    assert cache.get("a") is None
+
+def test_replacement_too_large_to_cache_drops_the_stale_value():
+    cache = LRUCache(max_bytes=entry_size("a", "x" * 100))
+    cache.put("a", "old")
+    cache.put("a", "x" * 1000)
+
+    assert cache.get("a") is None
+    assert cache.stats()["entries"] == 0
+    assert cache.stats()["bytes"] == 0
@@ -0,0 +1,117 @@
+import os
+import sys
+import time
+import numpy as np
+import pytest
+from llama_index.core.vector_stores.types import VectorStoreQuery
+
+# Import the replica module on its own, without initializing the API app and its LLM clients
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app"))
+from replica import VectorReplica, _ReplicaSnapshot, parse, query_terms  # noqa: E402
+
+# The expected lexemes and scores below are those of Postgres 16, so a change that breaks them
+# also breaks the parity of the replica's sparse results with PGVectorStore's
+
+def lexemes(content: str) -> list[str]:
+    return sorted({lexeme for group in parse(content) for lexeme in group})
+
+@pytest.mark.parametrize("content, expected", [
+    # Hyphenated words give their own lexeme, then those of their parts
+    ("Wi-Fi 6E", ["6e", "fi", "wi", "wi-fi"]),
+    ("self-service portal", ["portal", "self", "self-servic", "servic"]),
+    ("i9-13900K", ["13900k", "i9", "i9-13900k"]),
+    # A compound starting with a digit is split into separate words
+    ("768-dim embeddings", ["768", "dim", "embed"]),
+    # Paths, host names and version numbers are kept whole
+    ("/usr/local/bin/update", ["/usr/local/bin/update"]),
+    ("see drivers/net/e1000 for details", ["detail", "drivers/net/e1000", "see"]),
+    ("downloadcenter.intel.com", ["downloadcenter.intel.com"]),
+    ("version 1.2.3", ["1.2.3", "version"]),
+    # Words with digits are lowercased but not stemmed
+    ("Core i9 A770 drivers", ["a770", "core", "driver", "i9"]),
+    ("Thunderbolt 4 docks", ["4", "dock", "thunderbolt"]),
+    # Stopwords are dropped, including the parts of contractions
+    ("How do I update the driver of my NUC?", ["driver", "nuc", "updat"]),
+    ("The fans were running", ["fan", "run"]),
+    ("don't stop", ["stop"]),
+])
+def test_lexemes_match_to_tsvector(content, expected):
+    assert lexemes(content) == expected
+
+@pytest.mark.parametrize("query_str, expected", [
+    # to_tsquery(replace(plainto_tsquery('english', query)::text, '&', '|'))
+    ("How do I update the Wi-Fi drivers?", [["updat"], ["wi-fi", "wi", "fi"], ["wi"], ["fi"], ["driver"]]),
+    ("i9-13900K firmware", [["i9-13900k", "i9", "13900k"], ["i9"], ["13900k"], ["firmwar"]]),
+    # The lexemes are stemmed twice, and a stem may become a stopword
+    ("database embeddings", [["databa"], ["emb"]]),
+    ("only precision", [["preci"]]),
+    ("the of and", []),
+])
+def test_query_terms_match_pgvectorstore_query(query_str, expected):
+    assert query_terms(query_str) == expected
+
+def make_snapshot(scores_or_counts: list, dim: int = 2) -> _ReplicaSnapshot:
+    """A snapshot of one row per entry, with the given term counts or random embeddings."""
+    rows = len(scores_or_counts)
+    term_counts = [entry if isinstance(entry, dict) else {} for entry in scores_or_counts]
+    embeddings = np.random.default_rng(0).standard_normal((rows, dim)).astype(np.float32)
+    return _ReplicaSnapshot(
+        1,
+        np.arange(rows, dtype=np.int64),
+        [f"node-{i}" for i in range(rows)],
+        [f"text {i}" for i in range(rows)],
+        [{} for _ in range(rows)],
+        embeddings,
+        term_counts,
+    )
+
+@pytest.mark.parametrize("positions, query_str, expected", [
+    # ts_rank(to_tsvector('english', repeat('driver ', positions)), query), in single precision
+    (1, "driver", 0.06079271),
+    (2, "driver", 0.075990885),
+    (3, "driver", 0.082745634),
+    (10, "driver", 0.09421459),
+    # The tsvector keeps at most 255 positions of a lexeme
+    (300, "driver", 0.09976207),
+    # Lexemes of the query missing from the document still count in the average
+    (1, "driver firmware", 0.030396355),
+    (10, "driver firmware", 0.047107294),
+])
+def test_ts_rank_scores_match_postgres(positions, query_str, expected):
+    replica = VectorReplica(None, "data_test", 2)
+    rows = replica.sparse_search(make_snapshot([{"driver": positions}, {"firmwar": 1, "updat": 2}]), query_str, 5)
+    assert rows[0].node_id == "node-0"
+    assert np.float32(rows[0].similarity) == np.float32(expected)
+
+SCORES = np.asarray([0.5, 0.9, 0.5, 0.9, 0.1], dtype=np.float32)
+
+@pytest.mark.parametrize("k, expected", [
+    # Highest scores first, ties in row order, including at the k-th score
+    (1, [1]),
+    (3, [1, 3, 0]),
+    (4, [1, 3, 0, 2]),
+    # Without k, or with k beyond the rows, every row is returned
+    (None, [1, 3, 0, 2, 4]),
+    (10, [1, 3, 0, 2, 4]),
+    (0, []),
+])
+def test_top_rows_order_and_k(k, expected):
+    rows = VectorReplica._top_rows(make_snapshot(list(SCORES)), SCORES, k)
+    assert [row.node_id for row in rows] == [f"node-{i}" for i in expected]
+    assert [row.similarity for row in rows] == [float(SCORES[i]) for i in expected]
+
+def test_top_rows_maps_scores_to_their_rows():
+    snapshot = make_snapshot([0.0] * 6)
+    rows = VectorReplica._top_rows(snapshot, np.asarray([0.2, 0.8], dtype=np.float32), 1, np.asarray([4, 5]))
+    assert [row.node_id for row in rows] == ["node-5"]
+
+def test_query_without_top_k_returns_every_row():
+    replica = VectorReplica(None, "data_test", 2)
+    replica._snapshot = make_snapshot([{"driver": 1}, {"driver": 2}, {"firmwar": 1}])
+    replica._checked_at = time.monotonic()
+
+    dense = replica.query(VectorStoreQuery(query_embedding=[1.0, 0.0], similarity_top_k=None))
+    assert len(dense) == 3
+    assert [row.similarity for row in dense] == sorted((row.similarity for row in dense), reverse=True)
+    sparse = replica.query(VectorStoreQuery(query_str="drivers", similarity_top_k=None, mode="sparse"))
+    assert [row.node_id for row in sparse] == ["node-1", "node-0"]
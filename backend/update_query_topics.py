@@ -0,0 +1,36 @@
+import argparse
+import os
+import sys
+from datetime import datetime, timedelta
+from dotenv import load_dotenv
+from sqlalchemy import create_engine
+
+# Import the topics module on its own, without initializing the API app and its LLM clients
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "app"))
+from schema import upgrade_schema  # noqa: E402
+from topics import update_topics  # noqa: E402
+
+if __name__ == "__main__":
+    load_dotenv()
+
+    parser = argparse.ArgumentParser(description="Cluster the embeddings of new query logs into topics. Run it periodically, e.g. from cron.")
+    parser.add_argument("--topics", type=int, default=int(os.getenv("QUERY_TOPICS", 20)), help="Number of topics, used when seeding the topics.")
+    parser.add_argument("--batch-size", type=int, default=int(os.getenv("QUERY_TOPICS_BATCH_SIZE", 1000)), help="Number of query logs clustered per mini-batch.")
+    parser.add_argument("--since-days", type=int, help="Only cluster query logs of the last days. Clusters all query logs if not set.")
+    parser.add_argument("--representatives", type=int, default=5, help="Number of representative queries kept per topic.")
+    parser.add_argument("--rebuild", action="store_true", help="Clear the topics and cluster all query logs again.")
+    args = parser.parse_args()
+
+    engine = create_engine(os.getenv("CONNECTION_STRING"))
+    upgrade_schema(engine)
+
+    since = datetime.now() - timedelta(days=args.since_days) if args.since_days is not None else None
+    assigned = update_topics(
+        engine,
+        n_topics=args.topics,
+        batch_size=args.batch_size,
+        since=since,
+        n_representatives=args.representatives,
+        rebuild=args.rebuild,
+    )
+    print(f"Assigned {assigned} query logs to topics.")
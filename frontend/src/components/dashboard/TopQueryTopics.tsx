@@ -0,0 +1,93 @@
+import { useEffect, useState } from "react";
+import { Card, CardContent, CardHeader, CardTitle } from "@/components/ui/card";
+import { BarChart, Bar, XAxis, YAxis, Tooltip, ResponsiveContainer, TooltipProps } from "recharts";
+import { fetchQueryTopics, QueryTopic } from "@/services/api";
+import { Skeleton } from "@/components/ui/skeleton";
+
+const TopQueryTopics = () => {
+  const [data, setData] = useState<QueryTopic[]>([]);
+  const [isLoading, setIsLoading] = useState(true);
+
+  useEffect(() => {
+    const loadData = async () => {
+      setIsLoading(true);
+      try {
+        setData(await fetchQueryTopics());
+      } catch (error) {
+        console.error("Failed to load query topics:", error);
+      } finally {
+        setIsLoading(false);
+      }
+    };
+
+    loadData();
+  }, []);
+
+  // Shorten topic labels for display
+  const formattedData = data.map(item => {
+    const label = item.label || `Topic ${item.topic_id}`;
+    return {
+      ...item,
+      displayName: label.length > 20 ? label.substring(0, 20) + '...' : label,
+    };
+  });
+
+  const CustomTooltip = ({ active, payload }: TooltipProps<number, string>) => {
+    if (active && payload && payload.length) {
+      const topic = payload[0].payload as QueryTopic;
+      return (
+        <div className="bg-white p-2 border rounded shadow-sm text-xs max-w-[280px]">
+          <p className="font-medium">Queries: {topic.count} ({topic.share.toFixed(1)}%)</p>
+          <p>Success rate: {topic.success_rate.toFixed(1)}%</p>
+          <ul className="mt-1 list-disc pl-4">
+            {topic.representative_queries.map((query, index) => (
+              <li key={index} className="text-wrap">{query}</li>
+            ))}
+          </ul>
+        </div>
+      );
+    }
+    return null;
+  };
+
+  return (
+    <Card className="col-span-2">
+      <CardHeader>
+        <CardTitle>Top Query Topics</CardTitle>
+      </CardHeader>
+      <CardContent>
+        {isLoading ? (
+          <div className="w-full aspect-[2/1]">
+            <Skeleton className="w-full h-full" />
+          </div>
+        ) : data.length === 0 ? (
+          <div className="h-64 flex items-center justify-center text-muted-foreground">
+            No data available
+          </div>
+        ) : (
+          <div className="h-64">
+            <ResponsiveContainer width="100%" height="100%">
+              <BarChart 
+                data={formattedData} 
+                layout="vertical"
+                margin={{ top: 10, right: 30, left: 50, bottom: 0 }}
+              >
+                <XAxis type="number" tick={{ fontSize: 12 }} />
+                <YAxis 
+                  dataKey="displayName" 
+                  type="category" 
+                  tick={{ fontSize: 12 }} 
+                  width={100}
+                />
+                <Tooltip content={<CustomTooltip />} />
+                <Bar dataKey="count" fill="hsl(var(--primary))" radius={[0, 4, 4, 0]} />
+              </BarChart>
+            </ResponsiveContainer>
+          </div>
+        )}
+      </CardContent>
+    </Card>
+  );
+};
+
+export default TopQueryTopics;
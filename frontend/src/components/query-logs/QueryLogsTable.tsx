@@ -1,6 +1,9 @@
 import { useState, useEffect } from "react";
 import { fetchQueryLogs, QueryLog, CitedDocument } from "@/services/api";
 import { Button } from "@/components/ui/button";
+import { Input } from "@/components/ui/input";
+import { Label } from "@/components/ui/label";
+import { Switch } from "@/components/ui/switch";
 import { 
   Table, 
   TableBody, 
@@ -20,6 +23,9 @@ import {
   X, 
   FileText, 
   Clock,
+  Search,
+  ChevronLeft,
+  ChevronRight,
 } from "lucide-react";
 import { format } from "date-fns";
 import { Skeleton } from "@/components/ui/skeleton";
@@ -168,6 +174,9 @@ const CitedDocsDialog = ({ isOpen, onClose, documents, query }: CitedDocsDialogP
   );
 };
 
+// Number of query logs per page, each page loading its logs and their citations
+const PAGE_SIZE = 50;
+
 const QueryLogsTable = () => {
   const [logs, setLogs] = useState<QueryLog[]>([]);
   const [isLoading, setIsLoading] = useState(true);
@@ -175,35 +184,59 @@ const QueryLogsTable = () => {
   const [selectedQuery, setSelectedQuery] = useState("");
   const [isDialogOpen, setIsDialogOpen] = useState(false);
 
-  useEffect(() => {
-    const loadLogs = async () => {
-      setIsLoading(true);
-      try {
-        const queryLogs = await fetchQueryLogs();
-        // Sort by timestamp, newest first
+  const [searchQuery, setSearchQuery] = useState("");
+  const [fuzzy, setFuzzy] = useState(false);
+  const [activeSearch, setActiveSearch] = useState("");
+  const [activeFuzzy, setActiveFuzzy] = useState(false);
+  const [offset, setOffset] = useState(0);
+  const [hasNextPage, setHasNextPage] = useState(false);
+
+  const loadLogs = async (search: string = "", fuzzySearch: boolean = false, pageOffset: number = 0) => {
+    setIsLoading(true);
+    try {
+      // Fetch one more log than a page, to know whether there is a next page
+      const queryLogs = await fetchQueryLogs(true, true, search, fuzzySearch, PAGE_SIZE + 1, pageOffset);
+      setHasNextPage(queryLogs.length > PAGE_SIZE);
+      queryLogs.splice(PAGE_SIZE);
+      // Sort by timestamp, newest first, unless the logs are ranked by a search
+      if (!search) {
         queryLogs.sort((a, b) => 
           new Date(b.timestamp).getTime() - new Date(a.timestamp).getTime()
         );
-        // Process queryLogs to process the file_path, splitting by '\\tmp\\' if it is an absolute path
-        queryLogs.forEach(log => {
-          if (log.citations) {
-            log.citations.forEach(doc => {
-              const parts = doc.file_path.split('\\tmp\\');
-              doc.file_path = parts[parts.length - 1];
-            });
-          }
-        });
-        setLogs(queryLogs);
-      } catch (error) {
-        console.error("Failed to load query logs:", error);
-      } finally {
-        setIsLoading(false);
       }
-    };
+      // Process queryLogs to process the file_path, splitting by '\\tmp\\' if it is an absolute path
+      queryLogs.forEach(log => {
+        if (log.citations) {
+          log.citations.forEach(doc => {
+            const parts = doc.file_path.split('\\tmp\\');
+            doc.file_path = parts[parts.length - 1];
+          });
+        }
+      });
+      setLogs(queryLogs);
+      setActiveSearch(search);
+      setActiveFuzzy(fuzzySearch);
+      setOffset(pageOffset);
+    } catch (error) {
+      console.error("Failed to load query logs:", error);
+    } finally {
+      setIsLoading(false);
+    }
+  };
 
+  useEffect(() => {
     loadLogs();
   }, []);
 
+  const handleSearch = (e: React.FormEvent) => {
+    e.preventDefault();
+    loadLogs(searchQuery.trim(), fuzzy);
+  };
+
+  const loadPage = (pageOffset: number) => {
+    loadLogs(activeSearch, activeFuzzy, pageOffset);
+  };
+
   const showCitedDocuments = (log: QueryLog) => {
     setSelectedDocuments(log.citations || []);
     setSelectedQuery(log.query);
@@ -237,6 +270,30 @@ const QueryLogsTable = () => {
 
   return (
     <div className="space-y-4">
+      <form onSubmit={handleSearch} className="flex items-center gap-4">
+        <Input
+          value={searchQuery}
+          onChange={(e) => setSearchQuery(e.target.value)}
+          placeholder='Search queries, responses and errors, e.g. "fan curve" -xeon'
+          className="flex-1"
+          disabled={isLoading}
+        />
+        <div className="flex items-center gap-2">
+          <Switch id="fuzzy-search" checked={fuzzy} onCheckedChange={setFuzzy} disabled={isLoading} />
+          <Label htmlFor="fuzzy-search">Fuzzy</Label>
+        </div>
+        <Button type="submit" disabled={isLoading}>
+          <Search className="h-4 w-4 mr-2" />
+          Search
+        </Button>
+      </form>
+
+      {activeSearch && !isLoading && logs.length > 0 && (
+        <p className="text-sm text-muted-foreground">
+          Showing the most recent matches, ranked by relevance
+        </p>
+      )}
+
       {isLoading ? (
         <div className="space-y-2">
           {[...Array(5)].map((_, index) => (
@@ -245,7 +302,7 @@ const QueryLogsTable = () => {
         </div>
       ) : logs.length === 0 ? (
         <div className="text-center py-8 text-muted-foreground">
-          No query logs available
+          {activeSearch ? "No query logs match your search" : "No query logs available"}
         </div>
       ) : (
         <div className="border rounded-md overflow-hidden">
@@ -265,7 +322,7 @@ const QueryLogsTable = () => {
               {logs.map((log, index) => (
                 <TableRow key={log.id}>
                   <TableCell className="font-mono">
-                    {index + 1}
+                    {offset + index + 1}
                   </TableCell>
                   <TableCell className="max-w-[200px]">
                     <div className="truncate" title={log.query}>
@@ -316,6 +373,34 @@ const QueryLogsTable = () => {
         </div>
       )}
 
+      {!isLoading && (offset > 0 || hasNextPage) && (
+        <div className="flex items-center justify-between">
+          <p className="text-sm text-muted-foreground">
+            {logs.length > 0 ? `Showing ${offset + 1}-${offset + logs.length}` : ""}
+          </p>
+          <div className="flex items-center gap-2">
+            <Button
+              variant="outline"
+              size="sm"
+              onClick={() => loadPage(Math.max(offset - PAGE_SIZE, 0))}
+              disabled={offset === 0}
+            >
+              <ChevronLeft className="h-4 w-4 mr-1" />
+              Previous
+            </Button>
+            <Button
+              variant="outline"
+              size="sm"
+              onClick={() => loadPage(offset + PAGE_SIZE)}
+              disabled={!hasNextPage}
+            >
+              Next
+              <ChevronRight className="h-4 w-4 ml-1" />
+            </Button>
+          </div>
+        </div>
+      )}
+
       <CitedDocsDialog 
         isOpen={isDialogOpen}
         onClose={() => setIsDialogOpen(false)}
@@ -3,6 +3,7 @@ import Layout from "@/components/layout/Layout";
 import MetricsCard from "@/components/dashboard/MetricsCard";
 import QueryVolumeData from "@/components/dashboard/QueryVolumeData";
 import TopQueriedDocuments from "@/components/dashboard/TopQueriedDocuments";
+import TopQueryTopics from "@/components/dashboard/TopQueryTopics";
 import { fetchLLMResponseMetrics, LLMResponseMetrics } from "@/services/api";
 import { Clock, PercentSquare, Loader2 } from "lucide-react";
 import { Skeleton } from "@/components/ui/skeleton";
@@ -108,6 +109,7 @@ const Dashboard = () => {
           
           <QueryVolumeData />
           <TopQueriedDocuments />
+          <TopQueryTopics />
         </div>
       </div>
     </Layout>
@@ -19,6 +19,16 @@ export interface TopQueriedDocument {
   count: number;
 }
 
+export interface QueryTopic {
+  topic_id: number;
+  label: string | null;
+  representative_queries: string[];
+  count: number;
+  share: number;
+  success_rate: number;
+  avg_latency: number;
+}
+
 export interface CitedDocument {
   file_path: string;
   content: string;
@@ -39,6 +49,7 @@ export interface QueryLog {
   success: boolean;
   error: string | null;
   timestamp: string;
+  rank: number | null;
   citations: CitedDocument[];
 }
 
@@ -47,14 +58,39 @@ export interface ChatResponse {
   citations: CitedDocument[];
 }
 
+// Last ETag and body seen per analytics URL, used for conditional requests
+const conditionalCache = new Map<string, { etag: string; body: unknown }>();
+
+// GET an analytics endpoint, revalidating with If-None-Match so unchanged results come back as 304s
+const fetchConditional = async <T>(url: string): Promise<{ response: Response; data?: T }> => {
+  const cached = conditionalCache.get(url);
+  const response = await fetch(url, {
+    headers: cached ? { "If-None-Match": cached.etag } : {},
+  });
+
+  if (response.status === 304 && cached) {
+    return { response, data: cached.body as T };
+  }
+  if (!response.ok) {
+    return { response };
+  }
+
+  const data: T = await response.json();
+  const etag = response.headers.get("ETag");
+  if (etag) {
+    conditionalCache.set(url, { etag, body: data });
+  }
+  return { response, data };
+};
+
 // API Calls
 export const fetchQueryLogVolume = async (): Promise<QueryLogVolume> => {
   try {
-    const response = await fetch(`${API_BASE_URL}/query-log-volume/`);
-    if (!response.ok) {
+    const { response, data } = await fetchConditional<QueryLogVolume>(`${API_BASE_URL}/query-log-volume/`);
+    if (data === undefined) {
       throw new Error(`Error fetching query log volume: ${response.statusText}`);
     }
-    return await response.json();
+    return data;
   } catch (error) {
     console.error("Error fetching query log volume:", error);
     toast.error("Failed to fetch query volume data");
@@ -68,9 +104,6 @@ export const fetchQueryLogVolume = async (): Promise<QueryLogVolume> => {
 
 export const fetchLLMResponseMetrics = async (period: 'day' | 'week' | 'month'): Promise<LLMResponseMetrics> => {
   try {
-    let url = `${API_BASE_URL}/llm-response-metrics/`;
-    let body: string | undefined = undefined;
-
     const startDate = new Date();
     if (period === 'day') {
       startDate.setDate(startDate.getDate() - 1);
@@ -79,21 +112,15 @@ export const fetchLLMResponseMetrics = async (period: 'day' | 'week' | 'month'):
     } else if (period === 'month') {
       startDate.setDate(startDate.getDate() - 30);
     }
-    body = JSON.stringify({ start_date: startDate.toISOString().split('T')[0] });
+    const params = new URLSearchParams({ start_date: startDate.toISOString().split('T')[0] });
 
-    const response = await fetch(url, {
-      method: 'POST',
-      headers: {
-        "Content-Type": "application/json",
-      },
-      body: body,
-    });
+    const { response, data } = await fetchConditional<LLMResponseMetrics>(`${API_BASE_URL}/llm-response-metrics/?${params}`);
 
-    if (!response.ok) {
+    if (data === undefined) {
       throw new Error(`Error fetching LLM metrics: ${response.statusText}`);
     }
 
-    return await response.json();
+    return data;
   } catch (error) {
     console.error("Error fetching LLM metrics:", error);
     toast.error("Failed to fetch LLM metrics data");
@@ -103,18 +130,12 @@ export const fetchLLMResponseMetrics = async (period: 'day' | 'week' | 'month'):
 
 export const fetchTopQueriedDocuments = async (): Promise<TopQueriedDocument[]> => {
   try {
-    // Send k = 5 in a JSON body
-    const response = await fetch(`${API_BASE_URL}/top-queried-documents/`, {
-      method: "POST",
-      headers: {
-        "Content-Type": "application/json",
-      },
-      body: JSON.stringify({ k: 5 }),
-    });
-    if (!response.ok) {
+    // Send k = 5 in the query string
+    const { response, data } = await fetchConditional<TopQueriedDocument[]>(`${API_BASE_URL}/top-queried-documents/?k=5`);
+    if (data === undefined) {
       throw new Error(`Error fetching top queried documents: ${response.statusText}`);
     }
-    return await response.json();
+    return data;
   } catch (error) {
     console.error("Error fetching top queried documents:", error);
     toast.error("Failed to fetch top queried documents");
@@ -122,14 +143,35 @@ export const fetchTopQueriedDocuments = async (): Promise<TopQueriedDocument[]>
   }
 };
 
-export const fetchQueryLogs = async (include_citations: boolean = true, include_errors: boolean = true): Promise<QueryLog[]> => {
+export const fetchQueryTopics = async (): Promise<QueryTopic[]> => {
+  try {
+    const { response, data } = await fetchConditional<QueryTopic[]>(`${API_BASE_URL}/query-topics/?k=7`);
+    if (data === undefined) {
+      throw new Error(`Error fetching query topics: ${response.statusText}`);
+    }
+    return data;
+  } catch (error) {
+    console.error("Error fetching query topics:", error);
+    toast.error("Failed to fetch query topics");
+    return [];
+  }
+};
+
+export const fetchQueryLogs = async (
+  include_citations: boolean = true,
+  include_errors: boolean = true,
+  search: string = "",
+  fuzzy: boolean = false,
+  k: number | null = null,
+  offset: number = 0
+): Promise<QueryLog[]> => {
   try {
     const response = await fetch(`${API_BASE_URL}/query-logs/`, {
       method: "POST",
       headers: {
         "Content-Type": "application/json",
       },
-      body: JSON.stringify({ include_citations, include_errors }),
+      body: JSON.stringify({ include_citations, include_errors, search: search || null, fuzzy, k, offset }),
     });
     if (!response.ok) {
       throw new Error(`Error fetching query logs: ${response.statusText}`);